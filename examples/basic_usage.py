@@ -10,20 +10,22 @@ This example demonstrates how to:
 
 import sys
 import os
+import asyncio
 
 # Add the parent directory to the path to import the package
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-import dspy
-from metric_learner import (
-    MetricModule,
-    MetricDataManager,
-    label_instances,
-    optimize_metric_module,
-    get_labeled_dataset
-)
-
 def main():
+    # Imported lazily: metric_learner pulls in dspy, which is slow to import
+    from metric_learner import (
+        MetricModule,
+        MetricDataManager,
+        label_instances,
+        optimize_metric_module,
+        get_labeled_dataset,
+        LLMCache
+    )
+    
     # Initialize a language model (use your preferred model)
     # This example uses a mock LM for demonstration
     class MockLM:
@@ -35,7 +37,10 @@ def main():
     lm = MockLM()
     
     # Create a metric module and data manager
-    metric_module = MetricModule(lm=lm)
+    # The cache reuses scores for repeated (input, prediction, gold) requests.
+    # Use LLMCache(backend=FileBackend()) to persist scores across runs.
+    # Predictions that exactly match the gold answer are scored 1.0 without an LM call.
+    metric_module = MetricModule(lm=lm, cache=LLMCache(), trivial_shortcircuit=True)
     data_manager = MetricDataManager(metric_name="example_metric")
     
     # Example data
@@ -59,12 +64,8 @@ def main():
     
     # Score and save examples
     print("Scoring examples...")
-    for example in examples:
-        score = metric_module(
-            example["input"],
-            example["prediction"],
-            gold=example["gold"]
-        )
+    scores = asyncio.run(metric_module.abatch(examples))
+    for example, score in zip(examples, scores):
         print(f"Example: {example['input']}")
         print(f"Prediction: {example['prediction']}")
         print(f"Score: {score}")
@@ -103,12 +104,8 @@ def main():
         
         # Test the optimized module
         print("\nTesting optimized module...")
-        for example in examples:
-            new_score = optimized_module(
-                example["input"],
-                example["prediction"],
-                gold=example["gold"]
-            )
+        new_scores = asyncio.run(optimized_module.abatch(examples))
+        for example, new_score in zip(examples, new_scores):
             print(f"Example: {example['input']}")
             print(f"Optimized score: {new_score}")
     else:
@@ -9,7 +9,8 @@ This example demonstrates a complete workflow using the DSPy Metric Learning pac
 5. Using the optimized metric for scoring new examples
 """
 
-import dspy
+import asyncio
+import hashlib
 import os
 import sys
 from pathlib import Path
@@ -17,14 +18,6 @@ from pathlib import Path
 # Add the parent directory to the path to import the package when running directly
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from metric_learner import (
-    MetricModule,
-    MetricDataManager,
-    label_instances,
-    optimize_metric_module,
-    MetricEvaluator
-)
-
 # Sample data for demonstration
 EXAMPLES = [
     {
@@ -78,13 +71,24 @@ class MockLM:
     """Mock language model for demonstration purposes."""
     
     def __call__(self, prompt):
-        """Return a mock score between 0.7 and 0.95."""
-        import random
-        return str(round(random.uniform(0.7, 0.95), 2))
+        """Return a mock score between 0.7 and 0.95 derived from the prompt."""
+        # Hash the prompt so identical prompts get identical scores across runs
+        h = int.from_bytes(hashlib.blake2b(prompt.encode(), digest_size=4).digest(), "big")
+        return f"{0.7 + (h / 2**32) * 0.25:.2f}"
 
 
 def main():
     """Run the complete workflow example."""
+    # Imported lazily: metric_learner pulls in dspy, which is slow to import
+    from metric_learner import (
+        MetricModule,
+        MetricDataManager,
+        label_instances,
+        load_or_optimize_metric_module,
+        MetricEvaluator,
+        LLMCache
+    )
+    
     print("DSPy Metric Learning - Complete Workflow Example")
     print("-" * 50)
     
@@ -102,7 +106,8 @@ def main():
     os.makedirs(example_dir, exist_ok=True)
     
     # Create metric module and data manager
-    metric_module = MetricModule(lm=lm)
+    # The mock LM is deterministic, so repeated prompts can be served from the cache
+    metric_module = MetricModule(lm=lm, cache=LLMCache())
     data_manager = MetricDataManager(
         metric_name="example_metric",
         data_dir=example_dir
@@ -116,20 +121,13 @@ def main():
     
     # For this example, we'll use predefined data
     for example in EXAMPLES:
-        # Save the instance
-        data_manager.save_instance(
+        # Save the instance and record its user score
+        datetime_str = data_manager.save_instance(
             input=example["input"],
             prediction=example["prediction"],
             gold=example["gold"]
         )
-        
-        # Get the most recent instance and update its score
-        instances = data_manager.load_instances()
-        if instances:
-            data_manager.update_user_score(
-                instances[-1]["datetime"],
-                example["user_score"]
-            )
+        data_manager.update_user_score(datetime_str, example["user_score"])
     
     # Step 3: Optimize the metric
     print("\n3. Optimizing the metric...")
@@ -139,7 +137,17 @@ def main():
     print(f"   - Dataset size: {len(dataset)} examples")
     
     # Optimize the metric module
-    optimized_module = optimize_metric_module(metric_module, dataset)
+    # Optimizers that evaluate candidates in parallel (e.g. MIPROv2 via
+    # optimizer_class=dspy.teleprompt.MIPROv2) can be given num_threads=8;
+    # by default they use min(16, len(dataset)) threads.
+    # The optimized module is saved under examples/compiled/ and reused by
+    # later runs as long as the labeled dataset does not change.
+    optimized_module = load_or_optimize_metric_module(
+        metric_module,
+        dataset,
+        cache_dir=os.path.join(os.path.dirname(__file__), "compiled"),
+        name="example_metric"
+    )
     
     # Step 4: Evaluate the optimized metric
     print("\n4. Evaluating the optimized metric...")
@@ -154,20 +162,13 @@ def main():
     # Step 5: Use the optimized metric for new examples
     print("\n5. Using the optimized metric for new examples...")
     
+    # Score all test examples concurrently with both metrics
+    original_scores = asyncio.run(metric_module.abatch(TEST_EXAMPLES))
+    optimized_scores = asyncio.run(optimized_module.abatch(TEST_EXAMPLES))
+    
     for i, example in enumerate(TEST_EXAMPLES):
-        # Score with original metric
-        original_score = metric_module(
-            example["input"],
-            example["prediction"],
-            gold=example["gold"]
-        )
-        
-        # Score with optimized metric
-        optimized_score = optimized_module(
-            example["input"],
-            example["prediction"],
-            gold=example["gold"]
-        )
+        original_score = original_scores[i]
+        optimized_score = optimized_scores[i]
         
         print(f"\nExample {i+1}:")
         print(f"   - Input: {example['input']}")
@@ -9,19 +9,21 @@ This example shows how to:
 
 import sys
 import os
+import asyncio
 
 # Add the parent directory to the path to import the package
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-import dspy
-from metric_learner import (
-    MetricModule,
-    MetricDataManager,
-    label_instances,
-    optimize_metric_module
-)
-
 def main():
+    # Imported lazily: metric_learner pulls in dspy, which is slow to import
+    from metric_learner import (
+        MetricModule,
+        MetricDataManager,
+        label_instances,
+        optimize_metric_module,
+        LLMCache
+    )
+    
     # Initialize a mock language model for demonstration
     class MockLM:
         def __call__(self, prompt):
@@ -38,28 +40,39 @@ def main():
     
     lm = MockLM()
     
+    # Share one response cache between all metric modules
+    cache = LLMCache()
+    
     # Create multiple metric modules with different purposes
     accuracy_module = MetricModule(
         lm=lm,
+        cache=cache,
         prompt_template=(
-            "Rate the factual accuracy of the answer '{prediction}' for the question '{input}' "
-            "on a scale from 0 to 1, where 0 is completely incorrect and 1 is perfectly accurate."
+            "Rate the factual accuracy of the answer to the question below "
+            "on a scale from 0 to 1, where 0 is completely incorrect and 1 is perfectly accurate.\n\n"
+            "Question: {input}\n"
+            "Answer: {prediction}"
         )
     )
     
     fluency_module = MetricModule(
         lm=lm,
+        cache=cache,
         prompt_template=(
-            "Rate the fluency and readability of the answer '{prediction}' "
-            "on a scale from 0 to 1, where 0 is incomprehensible and 1 is perfectly fluent."
+            "Rate the fluency and readability of the answer below "
+            "on a scale from 0 to 1, where 0 is incomprehensible and 1 is perfectly fluent.\n\n"
+            "Answer: {prediction}"
         )
     )
     
     relevance_module = MetricModule(
         lm=lm,
+        cache=cache,
         prompt_template=(
-            "Rate the relevance of the answer '{prediction}' to the question '{input}' "
-            "on a scale from 0 to 1, where 0 is completely irrelevant and 1 is perfectly relevant."
+            "Rate the relevance of the answer to the question below "
+            "on a scale from 0 to 1, where 0 is completely irrelevant and 1 is perfectly relevant.\n\n"
+            "Question: {input}\n"
+            "Answer: {prediction}"
         )
     )
     
@@ -84,16 +97,25 @@ def main():
     
     # Score and save examples with multiple metrics
     print("Scoring examples with multiple metrics...")
-    for example in examples:
+    # Fluency and relevance do not use the gold answer
+    ungraded = [{"input": e["input"], "prediction": e["prediction"]} for e in examples]
+    
+    async def score_all_metrics():
+        # The three metrics are independent, so all their LM calls run concurrently
+        return await asyncio.gather(
+            accuracy_module.abatch(examples),
+            fluency_module.abatch(ungraded),
+            relevance_module.abatch(ungraded)
+        )
+    
+    accuracy_scores, fluency_scores, relevance_scores = asyncio.run(score_all_metrics())
+    
+    for i, example in enumerate(examples):
         print(f"\nExample: {example['input']}")
         print(f"Prediction: {example['prediction']}")
         
         # Score with accuracy metric
-        accuracy_score = accuracy_module(
-            example["input"],
-            example["prediction"],
-            gold=example.get("gold")
-        )
+        accuracy_score = accuracy_scores[i]
         print(f"Accuracy score: {accuracy_score}")
         accuracy_data.save_instance(
             example["input"],
@@ -103,10 +125,7 @@ def main():
         )
         
         # Score with fluency metric
-        fluency_score = fluency_module(
-            example["input"],
-            example["prediction"]
-        )
+        fluency_score = fluency_scores[i]
         print(f"Fluency score: {fluency_score}")
         fluency_data.save_instance(
             example["input"],
@@ -115,10 +134,7 @@ def main():
         )
         
         # Score with relevance metric
-        relevance_score = relevance_module(
-            example["input"],
-            example["prediction"]
-        )
+        relevance_score = relevance_scores[i]
         print(f"Relevance score: {relevance_score}")
         relevance_data.save_instance(
             example["input"],
@@ -145,12 +161,8 @@ def main():
         
         # Test the optimized module
         print("\nTesting optimized accuracy metric...")
-        for example in examples:
-            new_score = optimized_accuracy(
-                example["input"],
-                example["prediction"],
-                gold=example.get("gold")
-            )
+        new_scores = asyncio.run(optimized_accuracy.abatch(examples))
+        for example, new_score in zip(examples, new_scores):
             print(f"Example: {example['input']}")
             print(f"Optimized accuracy score: {new_score}")
 
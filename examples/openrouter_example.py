@@ -3,8 +3,10 @@
 Example of using DSPy Metric Learning with OpenRouter's Gemini model.
 """
 
+import os
+
 import dspy
-from metric_learner import MetricLearner, MetricModule
+from metric_learner import MetricLearner, MetricModule, hash_trainset
 
 # Configure DSPy to use OpenRouter with Gemini model
 # API key is loaded automatically from environment
@@ -15,9 +17,12 @@ dspy.settings.configure(lm=lm)
 metric_module = MetricModule(
     lm=lm,
     prompt_template=(
-        "Rate the quality of the answer '{prediction}' for the question '{input}' "
+        "Rate the quality of the answer to the question below "
         "on a scale from 0 to 1, where 0 is completely incorrect and 1 is perfect. "
-        "If the gold answer '{gold}' is provided, check if the prediction contains this information."
+        "If a gold answer is provided, check if the prediction contains this information.\n\n"
+        "Question: {input}\n"
+        "Answer: {prediction}\n"
+        "Gold answer: {gold}"
     )
 )
 
@@ -54,8 +59,20 @@ train_examples = [
     ).with_inputs("question") for item in train_data
 ]
 
-# Run the optimization
-optimized_program = metric_learner.optimize(train_examples)
+# Run the optimization, or reuse the program compiled for this training set
+# by a previous run
+compiled_path = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "compiled",
+    f"simple_qa_{hash_trainset(train_examples)[:16]}.json"
+)
+if os.path.exists(compiled_path):
+    optimized_program = SimpleQA()
+    optimized_program.load(compiled_path)
+else:
+    optimized_program = metric_learner.optimize(train_examples)
+    os.makedirs(os.path.dirname(compiled_path), exist_ok=True)
+    optimized_program.save(compiled_path)
 
 # Test the optimized program
 test_question = "What is the capital of Italy?"
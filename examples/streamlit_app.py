@@ -10,7 +10,6 @@ This app provides a user interface for:
 import sys
 import os
 import streamlit as st
-import pandas as pd
 from datetime import datetime
 
 # Add the parent directory to the path to import the package
@@ -19,7 +18,8 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 from metric_learner import (
     MetricModule,
     MetricDataManager,
-    optimize_metric_module
+    optimize_metric_module,
+    LLMCache
 )
 
 # Mock LM for demonstration
@@ -29,17 +29,49 @@ class MockLM:
         # In a real scenario, this would call the actual LM
         return "0.75"
 
+def data_version(data_manager):
+    """Modification times that change whenever instances are saved or updated."""
+    log_mtime = os.stat(data_manager.log_path).st_mtime_ns if os.path.exists(data_manager.log_path) else 0
+    return os.stat(data_manager.data_dir).st_mtime_ns, log_mtime
+
+@st.cache_data(ttl=60, show_spinner=False)
+def cached_instances(metric_name, version):
+    """
+    Load instances for a metric, reusing the result across reruns.
+    
+    The version argument is part of the cache key, so any write to the
+    metric's data invalidates the cached instances. The result is shared
+    across sessions, so it is loaded by a fresh data manager rather than
+    by one of the sessions' managers.
+    """
+    return MetricDataManager(metric_name=metric_name).load_instances()
+
+def load_instances(metric_name):
+    """Load instances for a metric through the cache."""
+    data_manager = st.session_state.data_managers[metric_name]
+    return cached_instances(metric_name, data_version(data_manager))
+
+def is_duplicate(metric_name, input, prediction, gold=None):
+    """Check whether an identical instance has already been saved."""
+    return any(
+        i["input"] == input and i["prediction"] == prediction and i.get("gold") == gold
+        for i in load_instances(metric_name)
+    )
+
 # Initialize session state
 if 'metric_modules' not in st.session_state:
     lm = MockLM()
     st.session_state.lm = lm
+    cache = LLMCache()
     st.session_state.metric_modules = {
-        'accuracy': MetricModule(lm=lm, prompt_template="Rate the factual accuracy of '{prediction}' for '{input}' from 0 to 1."),
-        'fluency': MetricModule(lm=lm, prompt_template="Rate the fluency of '{prediction}' from 0 to 1."),
-        'relevance': MetricModule(lm=lm, prompt_template="Rate the relevance of '{prediction}' to '{input}' from 0 to 1.")
+        'accuracy': MetricModule(lm=lm, cache=cache, prompt_template="Rate the factual accuracy of the answer from 0 to 1.\n\nQuestion: {input}\nAnswer: {prediction}"),
+        'fluency': MetricModule(lm=lm, cache=cache, prompt_template="Rate the fluency of the answer from 0 to 1.\n\nAnswer: {prediction}"),
+        'relevance': MetricModule(lm=lm, cache=cache, prompt_template="Rate the relevance of the answer to the question from 0 to 1.\n\nQuestion: {input}\nAnswer: {prediction}")
     }
+    # Each session runs in its own thread and data managers are not
+    # thread-safe, so every session gets its own managers
     st.session_state.data_managers = {
-        name: MetricDataManager(metric_name=name) 
+        name: MetricDataManager(metric_name=name)
         for name in st.session_state.metric_modules
     }
     st.session_state.optimized_modules = {}
@@ -79,8 +111,8 @@ if page == "Home":
     st.subheader("Metrics Statistics")
     
     stats = []
-    for name, dm in st.session_state.data_managers.items():
-        instances = dm.load_instances()
+    for name in st.session_state.data_managers:
+        instances = load_instances(name)
         labeled = [i for i in instances if i.get("user_score") is not None]
         stats.append({
             "Metric": name,
@@ -90,6 +122,8 @@ if page == "Home":
         })
     
     if stats:
+        # pandas is only needed to render tables, so import it on first use
+        import pandas as pd
         st.table(pd.DataFrame(stats))
     else:
         st.info("No metrics data available yet.")
@@ -99,8 +133,11 @@ elif page == "Label Instances":
     st.subheader(f"Label Instances for {selected_metric}")
     
     data_manager = st.session_state.data_managers[selected_metric]
-    instances = data_manager.load_instances()
+    instances = load_instances(selected_metric)
+    # Take the next instance and the progress from the same snapshot
     unlabeled = [i for i in instances if i.get("user_score") is None]
+    instance = unlabeled[0] if unlabeled else None
+    num_labeled = len(instances) - len(unlabeled)
     
     if not instances:
         st.info("No instances available. Add some examples first.")
@@ -129,7 +166,7 @@ elif page == "Label Instances":
                 st.success("Example added successfully!")
                 st.experimental_rerun()
     
-    elif not unlabeled:
+    elif instance is None:
         st.success("All instances are labeled! Go to the Optimize page to train your metric.")
         
         # Show labeled instances
@@ -145,8 +182,6 @@ elif page == "Label Instances":
     
     else:
         # Show unlabeled instance for labeling
-        instance = unlabeled[0]
-        
         st.text(f"Input: {instance['input']}")
         st.text(f"Prediction: {instance['prediction']}")
         if instance.get("gold"):
@@ -165,8 +200,8 @@ elif page == "Label Instances":
             st.experimental_rerun()
         
         # Progress
-        st.progress(len(instances) - len(unlabeled) / max(1, len(instances)))
-        st.text(f"Labeled {len(instances) - len(unlabeled)}/{len(instances)} instances")
+        st.progress(num_labeled / max(1, len(instances)))
+        st.text(f"Labeled {num_labeled}/{len(instances)} instances")
 
 # Optimize Metrics page
 elif page == "Optimize Metrics":
@@ -208,6 +243,7 @@ elif page == "Optimize Metrics":
             })
         
         if data:
+            import pandas as pd
             st.table(pd.DataFrame(data))
 
 # Test Metrics page
@@ -264,13 +300,16 @@ elif page == "Test Metrics":
         
         # Option to save this example
         if st.button("Save this example"):
-            data_manager = st.session_state.data_managers[selected_metric]
-            data_manager.save_instance(
-                input_text,
-                prediction,
-                gold=gold if gold else None,
-                score=original_score
-            )
-            st.success("Example saved!")
+            if is_duplicate(selected_metric, input_text, prediction, gold if gold else None):
+                st.warning("This example has already been saved.")
+            else:
+                data_manager = st.session_state.data_managers[selected_metric]
+                data_manager.save_instance(
+                    input_text,
+                    prediction,
+                    gold=gold if gold else None,
+                    score=original_score
+                )
+                st.success("Example saved!")
 
 # Run the app with: streamlit run examples/streamlit_app.py --server.headless=true
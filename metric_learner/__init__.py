@@ -1,15 +1,40 @@
-from .metric_module import MetricModule
-from .data_manager import MetricDataManager
-from .repl_interface import label_instances
-from .optimization import optimize_metric_module, get_labeled_dataset, MetricEvaluator
-from .learner import MetricLearner
-
-__all__ = [
-    'MetricModule',
-    'MetricDataManager',
-    'label_instances',
-    'optimize_metric_module',
-    'get_labeled_dataset',
-    'MetricEvaluator',
-    'MetricLearner',
-]
+"""
+DSPy Metric Learning.
+
+Public names are imported on first use (PEP 562), so that e.g.
+``from metric_learner import MetricDataManager`` does not import dspy.
+"""
+import importlib
+
+# Public name -> submodule defining it
+_EXPORTS = {
+    'MetricModule': '.metric_module',
+    'MetricDataManager': '.data_manager',
+    'LabeledArrays': '.data_manager',
+    'label_instances': '.repl_interface',
+    'optimize_metric_module': '.optimization',
+    'load_or_optimize_metric_module': '.optimization',
+    'hash_trainset': '.optimization',
+    'get_labeled_dataset': '.optimization',
+    'MetricEvaluator': '.optimization',
+    'MetricLearner': '.learner',
+    'LLMCache': '.llm_cache',
+    'MemoryBackend': '.llm_cache',
+    'FileBackend': '.llm_cache',
+    'SemanticCache': '.llm_cache',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    # Cache the name so later lookups bypass __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
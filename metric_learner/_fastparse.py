@@ -0,0 +1,69 @@
+import re
+import math
+
+# First integer or decimal number in a free-form response
+_NUMBER_PATTERN = re.compile(r'(-?\d+\.\d+|-?\d+)')
+
+
+def parse_score(response, default=0.5):
+    """
+    Extract a score between 0 and 1 from an LM response.
+    
+    Most responses are a bare number such as "0.85", which is converted with
+    a single float() call. Anything else falls back to searching the text for
+    the first number.
+    
+    Args:
+        response: The LM's response string
+        default: Score to return if no number can be found
+        
+    Returns:
+        float: A score clamped to the range [0, 1]
+    """
+    cleaned = response.strip()
+    
+    try:
+        score = float(cleaned)
+    except ValueError:
+        score = None
+    
+    # Reject nan/inf, and fall back to searching the text
+    if score is None or not math.isfinite(score):
+        match = _NUMBER_PATTERN.search(cleaned)
+        if not match:
+            return default
+        score = float(match.group(1))
+    
+    # Ensure the score is between 0 and 1
+    if score < 0.0:
+        return 0.0
+    elif score > 1.0:
+        return 1.0
+    return score
+
+
+def has_complete_score(text):
+    """
+    Check whether a partial response already contains its final score.
+    
+    The first number in a response is complete once a character follows it
+    that cannot extend it, e.g. "0.85 " but not "0" or "0." which may still
+    grow into "0.85". parse_score() on the full response would then return
+    the same value, so a streamed response can be cut off at this point.
+    
+    Args:
+        text: The response text received so far
+        
+    Returns:
+        bool: True if the first number in the text can no longer change
+    """
+    match = _NUMBER_PATTERN.search(text)
+    if not match:
+        return False
+    following = text[match.end():match.end() + 2]
+    if not following:
+        return False
+    # A "." after an integer may still be followed by decimal digits
+    if following[0] == "." and "." not in match.group(1) and (len(following) < 2 or following[1].isdigit()):
+        return False
+    return True
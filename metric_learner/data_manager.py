@@ -1,7 +1,139 @@
+from __future__ import annotations
+
 import os
+import re
 import json
-from datetime import datetime
-import dspy
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from operator import itemgetter
+from typing import TYPE_CHECKING, List, Optional
+
+if TYPE_CHECKING:
+    import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Append-only log holding one JSON instance per line
+INSTANCES_FILE = "instances.jsonl"
+
+# File locked while the log is written, so that appends and compaction by
+# several managers or processes do not interleave
+LOCK_FILE = "instances.jsonl.lock"
+
+# Number of legacy files to parse above which they are read by a thread pool
+PARALLEL_READ_MIN = 64
+
+# Legacy file name derived from an ISO datetime with ':' and '.' replaced by '-'
+_LEGACY_NAME = re.compile(r"^(\d{4}-\d{2}-\d{2}T\d{2})-(\d{2})-(\d{2})(?:-(\d{6}))?\.json$")
+
+def _dumps(obj, indent=False):
+    """Serialize an object to JSON bytes, using orjson if installed.
+    
+    Output is compact unless ``indent`` is set, in which case it is indented
+    by two spaces like the per-instance files of earlier versions.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    if indent:
+        return json.dumps(obj, indent=2).encode("utf-8")
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+def _loads(data):
+    """Deserialize JSON bytes, using orjson if installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _read_bytes(path):
+    """Read a file, returning the error instead of raising it."""
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError as e:
+        return e
+
+def _merge_record(records, record):
+    """
+    Apply a log record to a dict of instances keyed by datetime.
+    
+    Full instances replace any earlier record; partial updates are merged
+    over the instance they refer to and ignored if it is unknown.
+    """
+    key = record.get("datetime")
+    if key in records:
+        records[key] = {**records[key], **record}
+    elif "input" in record:
+        records[key] = record
+
+@dataclass
+class LabeledArrays:
+    """
+    Labeled instances stored as parallel columns.
+    
+    Keeping the user scores in one contiguous array lets evaluation code
+    run NumPy reductions over them directly instead of reading an
+    attribute from every example.
+    """
+    inputs: List[str]
+    predictions: List[str]
+    golds: List[Optional[str]]
+    user_scores: np.ndarray
+    
+    def __len__(self):
+        return len(self.user_scores)
+    
+    @classmethod
+    def from_instances(cls, instances):
+        """
+        Build columns from stored instance dicts, keeping only labeled ones.
+        
+        Args:
+            instances: List of instance dicts as returned by load_instances()
+            
+        Returns:
+            LabeledArrays: Columns for the labeled instances
+        """
+        # Imported here so that labeling instances does not pull in numpy
+        import numpy as np
+        
+        rows = [i for i in instances if i.get("user_score") is not None]
+        return cls(
+            inputs=[r["input"] for r in rows],
+            predictions=[r["prediction"] for r in rows],
+            golds=[r.get("gold") for r in rows],
+            user_scores=np.fromiter((r["user_score"] for r in rows), dtype=np.float64, count=len(rows))
+        )
+    
+    @classmethod
+    def from_examples(cls, examples):
+        """
+        Build columns from labeled dspy.Example objects.
+        
+        Args:
+            examples: List of examples as returned by get_labeled_dataset()
+            
+        Returns:
+            LabeledArrays: Columns for the examples
+        """
+        import numpy as np
+        
+        return cls(
+            inputs=[e.input for e in examples],
+            predictions=[e.prediction for e in examples],
+            golds=[e.gold for e in examples],
+            user_scores=np.fromiter((e.user_score for e in examples), dtype=np.float64, count=len(examples))
+        )
 
 class MetricDataManager:
     """
@@ -9,6 +141,12 @@ class MetricDataManager:
     
     Each instance contains input, prediction, gold standard (optional),
     model score, user score (optional), and timestamp.
+    
+    Instances are appended to a JSON Lines log. Updating an instance appends
+    a small record holding only its datetime and the changed fields, which
+    is merged over the earlier record when the log is read. Instances
+    stored as individual JSON files by earlier versions are still loaded
+    and updated in place.
     """
     
     def __init__(self, metric_name, data_dir=".metrics_data"):
@@ -21,7 +159,236 @@ class MetricDataManager:
         """
         self.metric_name = metric_name
         self.data_dir = os.path.join(os.path.expanduser("~"), data_dir, metric_name)
+        self.log_path = os.path.join(self.data_dir, INSTANCES_FILE)
+        self._lock_path = os.path.join(self.data_dir, LOCK_FILE)
         os.makedirs(self.data_dir, exist_ok=True)
+        
+        # Datetime -> path of legacy per-instance files, built on first use
+        self._legacy_paths = None
+        
+        # Path -> ((size, mtime), instance) of parsed legacy files
+        self._legacy_cache = {}
+        
+        # Datetime of the last saved instance, used to keep keys unique
+        self._last_saved = None
+        
+        # Unlabeled instances in datetime order, rebuilt whenever
+        # load_instances() rereads the data
+        self._unlabeled = None
+        
+        # Latest log record per datetime, valid while the log's size and
+        # mtime match _log_stat
+        self._log_index = None
+        self._log_stat = None
+        
+        # Parsed instances and labeled dataset, valid while _storage_key()
+        # returns _instances_key
+        self._instances = None
+        self._labeled_dataset = None
+        self._instances_key = None
+
+    def _stat_log(self):
+        """Return (size, mtime) of the log, or None if it does not exist."""
+        try:
+            st = os.stat(self.log_path)
+        except FileNotFoundError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    @contextmanager
+    def _locked(self):
+        """
+        Hold an exclusive lock on the log while writing to it.
+        
+        The lock is taken on a separate file, since compact_log() replaces
+        the log itself. Where fcntl is unavailable (e.g. on Windows) no lock
+        is taken.
+        """
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _append(self, record):
+        """Append an instance, or an update to one, to the log."""
+        with self._locked():
+            self._append_locked(record)
+
+    def _append_locked(self, record):
+        """Append a record to the log; the caller holds _locked()."""
+        fresh = self._log_index is not None and self._log_stat == self._stat_log()
+        with open(self.log_path, "ab") as f:
+            f.write(_dumps(record) + b"\n")
+        
+        # Keep the index in sync with our own writes; anything else forces a reread
+        if fresh:
+            _merge_record(self._log_index, record)
+            self._log_stat = self._stat_log()
+        else:
+            self._log_index = None
+
+    def _read_log(self):
+        """
+        Get the latest record for each datetime, rereading the log only if
+        it has changed since it was last read.
+        
+        Returns:
+            dict: Latest record for each datetime, in log order
+        """
+        stat = self._stat_log()
+        if self._log_index is None or stat != self._log_stat:
+            self._log_index = self._load_log()
+            self._log_stat = stat
+        return self._log_index
+
+    def _storage_key(self):
+        """
+        Return a value that changes whenever instances are added or updated.
+        
+        Appends change the log's size and mtime, and new legacy files change
+        the directory's mtime. Legacy files rewritten in place by another
+        process are not detected.
+        """
+        return os.stat(self.data_dir).st_mtime_ns, self._stat_log()
+
+    def _invalidate(self):
+        """Drop the cached instances after a write."""
+        self._instances = None
+        self._labeled_dataset = None
+        self._instances_key = None
+
+    def _legacy_path(self, datetime_str):
+        """Return the file name earlier versions used for an instance."""
+        timestamp = datetime_str.replace(":", "-").replace(".", "-")
+        return os.path.join(self.data_dir, f"{timestamp}.json")
+
+    def _load_log(self):
+        """
+        Read the instance log.
+        
+        Returns:
+            dict: Latest record for each datetime, in log order
+        """
+        records = {}
+        
+        if not os.path.exists(self.log_path):
+            return records
+        
+        with open(self.log_path, "rb") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    instance = _loads(line)
+                except ValueError as e:
+                    print(f"Error loading {INSTANCES_FILE} line {line_number}: {e}")
+                    continue
+                _merge_record(records, instance)
+                
+        return records
+
+    def _legacy_files(self):
+        """
+        List the per-instance JSON files written by earlier versions.
+        
+        Returns:
+            list: os.DirEntry objects for the legacy files
+        """
+        # DirEntry carries the name, path and file type from a single
+        # directory read, so no per-file path joins or stat calls are needed
+        with os.scandir(self.data_dir) as entries:
+            return [e for e in entries if e.name.endswith(".json") and e.is_file()]
+
+    def _load_legacy(self):
+        """
+        Parse every legacy per-instance file and index them by datetime.
+        
+        Files whose size and mtime are unchanged since they were last parsed
+        are served from a cache, so only new or rewritten files are read.
+        
+        Returns:
+            list: The instances stored in legacy files
+        """
+        instances = []
+        paths = {}
+        cache = {}
+        stale = []
+        for entry in self._legacy_files():
+            try:
+                st = entry.stat()
+            except OSError as e:
+                print(f"Error loading {entry.name}: {e}")
+                continue
+            version = (st.st_size, st.st_mtime_ns)
+            cached = self._legacy_cache.get(entry.path)
+            if cached is not None and cached[0] == version:
+                cache[entry.path] = cached
+            else:
+                stale.append((entry, version))
+        
+        # Reading releases the GIL, so many files are read concurrently;
+        # decoding stays on this thread
+        paths_to_read = [entry.path for entry, _ in stale]
+        if len(paths_to_read) >= PARALLEL_READ_MIN:
+            workers = min(32, (os.cpu_count() or 1) * 4)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                contents = list(executor.map(_read_bytes, paths_to_read))
+        else:
+            contents = [_read_bytes(path) for path in paths_to_read]
+        
+        for (entry, version), data in zip(stale, contents):
+            try:
+                if isinstance(data, Exception):
+                    raise data
+                cache[entry.path] = (version, _loads(data))
+            except Exception as e:
+                print(f"Error loading {entry.name}: {e}")
+        
+        for path, (_, instance) in cache.items():
+            instances.append(instance)
+            paths[instance.get("datetime")] = path
+        # Drop entries for files that no longer exist
+        self._legacy_cache = cache
+        self._legacy_paths = paths
+        return instances
+
+    def _find_legacy(self, datetime_str):
+        """Return the path of the legacy file holding an instance, or None."""
+        # Files are normally named after their datetime
+        path = self._legacy_path(datetime_str)
+        if os.path.exists(path):
+            return path
+        # Otherwise use the index, rebuilding it if it is missing or stale
+        path = (self._legacy_paths or {}).get(datetime_str)
+        if path is None or not os.path.exists(path):
+            self._load_legacy()
+            path = self._legacy_paths.get(datetime_str)
+        return path
+
+    def _next_datetime(self, taken):
+        """
+        Return a unique, increasing datetime string for a new instance.
+        
+        The datetime identifies an instance, so saves within the same
+        microsecond as the previous save (or after the clock steps back), or
+        as an instance saved by another manager, are moved one microsecond
+        later instead of colliding.
+        
+        Args:
+            taken: Datetimes of the instances already in the log
+        """
+        now = datetime.now()
+        if self._last_saved is not None and now <= self._last_saved:
+            now = self._last_saved + timedelta(microseconds=1)
+        # Always include microseconds so that strings sort chronologically
+        key = now.isoformat(timespec="microseconds")
+        while key in taken:
+            now += timedelta(microseconds=1)
+            key = now.isoformat(timespec="microseconds")
+        self._last_saved = now
+        return key
 
     def save_instance(self, input, prediction, gold=None, score=None):
         """
@@ -34,7 +401,8 @@ class MetricDataManager:
             score: Optional model-generated score
             
         Returns:
-            str: Filename of the saved instance
+            str: Datetime of the new instance, which identifies it e.g. in
+                update_user_score()
         """
         # Create instance data
         instance = {
@@ -42,24 +410,35 @@ class MetricDataManager:
             "prediction": prediction,
             "gold": gold,
             "score": score,
-            "user_score": None,
-            "datetime": datetime.now().isoformat()
+            "user_score": None
         }
         
-        # Generate filename based on timestamp
-        timestamp = instance["datetime"].replace(":", "-").replace(".", "-")
-        filename = os.path.join(self.data_dir, f"{timestamp}.json")
-        
-        # Save to file
-        with open(filename, "w") as f:
-            json.dump(instance, f, indent=2)
+        # Choose the datetime under the lock, so that no other manager or
+        # process can append an instance with the same one in the meantime
+        with self._locked():
+            instance["datetime"] = self._next_datetime(self._read_log())
+            self._append_locked(instance)
+        self._invalidate()
             
-        return filename
+        return instance["datetime"]
 
     def load_instances(self):
         """
         Load all instances from the data directory.
         
+        Returns:
+            list: Sorted list of instances by datetime. Each call returns new
+                dicts, so callers may modify them freely.
+        """
+        return [dict(instance) for instance in self._cached_instances()]
+
+    def _cached_instances(self):
+        """
+        Get the parsed instances, rereading them only if the data changed.
+        
+        The returned list and its dicts are shared with the log index and
+        the legacy file cache and must not be modified.
+        
         Returns:
             list: Sorted list of instances by datetime
         """
@@ -67,20 +446,121 @@ class MetricDataManager:
         
         # Check if directory exists
         if not os.path.exists(self.data_dir):
+            self._invalidate()
+            self._unlabeled = deque()
             return instances
+        
+        # Reuse the parsed instances if nothing has been written since
+        key = self._storage_key()
+        if self._instances is not None and key == self._instances_key:
+            return self._instances
             
-        # Load each JSON file
-        for filename in os.listdir(self.data_dir):
-            if filename.endswith(".json"):
-                try:
-                    with open(os.path.join(self.data_dir, filename), "r") as f:
-                        instance = json.load(f)
-                        instances.append(instance)
-                except Exception as e:
-                    print(f"Error loading {filename}: {e}")
-                    
+        # Load the instance log
+        try:
+            instances.extend(self._read_log().values())
+        except Exception as e:
+            print(f"Error loading {INSTANCES_FILE}: {e}")
+        
+        # Load each legacy JSON file
+        instances.extend(self._load_legacy())
+        
         # Sort by datetime
-        return sorted(instances, key=lambda x: x.get("datetime", ""))
+        try:
+            # itemgetter avoids a Python-level call per instance
+            instances.sort(key=itemgetter("datetime"))
+        except KeyError:
+            # Hand-written legacy files may lack a datetime
+            instances.sort(key=lambda x: x.get("datetime", ""))
+        
+        self._unlabeled = deque(i for i in instances if i.get("user_score") is None)
+        self._instances = instances
+        self._labeled_dataset = None
+        self._instances_key = key
+        return instances
+
+    def load_instance_headers(self):
+        """
+        List the datetimes of all instances without loading the instances.
+        
+        Legacy files named after their datetime are listed from the directory
+        entry alone; only renamed legacy files are opened.
+        
+        Returns:
+            list: Dicts with a 'datetime' key, sorted by datetime
+        """
+        if not os.path.exists(self.data_dir):
+            return []
+        
+        datetimes = set(self._read_log())
+        for entry in self._legacy_files():
+            match = _LEGACY_NAME.match(entry.name)
+            if match is None:
+                # A renamed file: read the datetimes recorded in all legacy files
+                self._load_legacy()
+                datetimes.update(self._legacy_paths)
+                break
+            hour, minute, second, micro = match.groups()
+            datetimes.add(f"{hour}:{minute}:{second}" + (f".{micro}" if micro else ""))
+        
+        return [{"datetime": dt} for dt in sorted(dt for dt in datetimes if dt is not None)]
+
+    def next_unlabeled(self):
+        """
+        Get the oldest instance without a user score.
+        
+        Returns:
+            dict: The instance, or None if every instance is labeled
+        """
+        # Rebuilds the queue if instances were written since the last load
+        self._cached_instances()
+        return dict(self._unlabeled[0]) if self._unlabeled else None
+
+    def iter_unlabeled(self):
+        """
+        Iterate over the instances without a user score, oldest first.
+        
+        Instances are yielded from the cached unlabeled queue instead of a
+        filtered copy of every instance. The set of instances is fixed when
+        iteration starts, so scores may be saved while iterating.
+        
+        Yields:
+            dict: Unlabeled instances sorted by datetime
+        """
+        self._cached_instances()
+        for instance in tuple(self._unlabeled):
+            yield dict(instance)
+
+    def count_instances(self):
+        """
+        Count all saved instances.
+        
+        Returns:
+            int: Number of instances
+        """
+        return len(self._cached_instances())
+
+    def count_unlabeled(self):
+        """
+        Count the instances without a user score.
+        
+        Returns:
+            int: Number of unlabeled instances
+        """
+        self._cached_instances()
+        return len(self._unlabeled)
+
+    def has_labeled(self):
+        """
+        Check whether any instance has a user score.
+        
+        Answered from the cached instances and the unlabeled queue, so it
+        only touches the disk if the data changed since the last load.
+        
+        Returns:
+            bool: True if at least one instance is labeled
+        """
+        instances = self._cached_instances()
+        return len(instances) > len(self._unlabeled or ())
 
     def update_user_score(self, datetime_str, user_score):
         """
@@ -93,28 +573,126 @@ class MetricDataManager:
         Returns:
             bool: True if update successful, False otherwise
         """
-        # Find the file with matching datetime
-        for filename in os.listdir(self.data_dir):
-            if filename.endswith(".json"):
-                filepath = os.path.join(self.data_dir, filename)
-                try:
-                    with open(filepath, "r") as f:
-                        instance = json.load(f)
-                    
-                    # Check if this is the instance we're looking for
-                    if instance.get("datetime") == datetime_str:
-                        # Update the user score
-                        instance["user_score"] = user_score
-                        
-                        # Save back to file
-                        with open(filepath, "w") as f:
-                            json.dump(instance, f, indent=2)
-                            
-                        return True
-                except Exception as e:
-                    print(f"Error updating {filename}: {e}")
-                    
-        return False
+        # Append just the changed score for a logged instance
+        try:
+            if datetime_str in self._read_log():
+                self._append({"datetime": datetime_str, "user_score": user_score})
+                self._invalidate()
+                return True
+        except Exception as e:
+            print(f"Error updating {INSTANCES_FILE}: {e}")
+            return False
+        
+        # Otherwise update the legacy file holding the instance
+        filepath = self._find_legacy(datetime_str)
+        if filepath is None:
+            return False
+        
+        try:
+            # Read and rewrite through one file handle
+            with open(filepath, "r+b") as f:
+                instance = _loads(f.read())
+                
+                # Check that this is the instance we're looking for
+                if instance.get("datetime") != datetime_str:
+                    return False
+                
+                # Update the user score and save it back with a single write
+                instance["user_score"] = user_score
+                f.seek(0)
+                f.truncate()
+                f.write(_dumps(instance, indent=True))
+        except Exception as e:
+            print(f"Error updating {os.path.basename(filepath)}: {e}")
+            return False
+        
+        self._invalidate()
+        return True
+        
+    def update_user_score_in_place(self, instance, user_score):
+        """
+        Update a loaded instance with a user-provided score.
+        
+        Like update_user_score(), but legacy files are rewritten from the
+        given instance instead of being read back and checked first. The
+        instance dict is updated on success.
+        
+        Args:
+            instance: Instance dict as returned by load_instances()
+            user_score: User-provided score (float between 0 and 1)
+            
+        Returns:
+            bool: True if update successful, False otherwise
+        """
+        datetime_str = instance.get("datetime")
+        try:
+            in_log = datetime_str in self._read_log()
+        except Exception as e:
+            print(f"Error updating {INSTANCES_FILE}: {e}")
+            return False
+        
+        if in_log:
+            success = self.update_user_score(datetime_str, user_score)
+        else:
+            filepath = self._find_legacy(datetime_str)
+            if filepath is None:
+                return False
+            try:
+                with open(filepath, "wb") as f:
+                    f.write(_dumps({**instance, "user_score": user_score}, indent=True))
+            except Exception as e:
+                print(f"Error updating {os.path.basename(filepath)}: {e}")
+                return False
+            self._invalidate()
+            success = True
+        
+        if success:
+            instance["user_score"] = user_score
+        return success
+        
+    def compact_log(self):
+        """
+        Rewrite the instance log with one line per instance.
+        
+        Score updates are appended as separate records, so a log that has
+        seen many labeling sessions holds several lines per instance. Folding
+        them keeps the log, and the time needed to read it, proportional to
+        the number of instances.
+        
+        Returns:
+            bool: True if the log was rewritten, False if it did not exist or
+                changed while being compacted
+        """
+        # Appends wait for the lock, so none can land between reading the
+        # log and replacing it
+        with self._locked():
+            # Rebuild from the file being replaced rather than the cached index,
+            # so that only what is on disk is ever written back
+            stat = self._stat_log()
+            if stat is None:
+                return False
+            records = self._load_log()
+            
+            tmp_path = f"{self.log_path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    f.write(b"".join(_dumps(record) + b"\n" for record in records.values()))
+                # Without a lock, keep records appended by another writer in the meantime
+                if self._stat_log() != stat:
+                    os.remove(tmp_path)
+                    return False
+                os.replace(tmp_path, self.log_path)
+            except Exception as e:
+                print(f"Error compacting {INSTANCES_FILE}: {e}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                return False
+            
+            # The merged records are unchanged, only their encoding on disk is
+            self._log_index = records
+            self._log_stat = self._stat_log()
+        self._invalidate()
+        return True
         
     def get_labeled_dataset(self):
         """
@@ -123,7 +701,12 @@ class MetricDataManager:
         Returns:
             list: List of dspy.Example objects
         """
-        instances = self.load_instances()
+        # Imported here so that loading and saving instances does not pull in dspy
+        import dspy
+        
+        instances = self._cached_instances()
+        if self._labeled_dataset is not None:
+            return list(self._labeled_dataset)
         dataset = []
         
         for instance in instances:
@@ -138,5 +721,16 @@ class MetricDataManager:
                 ).with_inputs("input", "prediction", "gold")
                 
                 dataset.append(example)
-                
-        return dataset
+        
+        # Cached until load_instances() next rereads the data
+        self._labeled_dataset = dataset
+        return list(dataset)
+
+    def get_labeled_arrays(self):
+        """
+        Get labeled instances as parallel columns.
+        
+        Returns:
+            LabeledArrays: Inputs, predictions, golds and a float64 array of user scores
+        """
+        return LabeledArrays.from_instances(self._cached_instances())
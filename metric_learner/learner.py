@@ -1,8 +1,13 @@
-import dspy
-from typing import List, Callable, Optional, Union, Any
+from __future__ import annotations
 
-from .metric_module import MetricModule
-from .optimization import optimize_metric_module
+from typing import TYPE_CHECKING, List, Callable, Optional, Union, Any
+
+from .optimization import num_threads_kwargs, optimize_metric_module
+
+if TYPE_CHECKING:
+    import dspy
+
+    from .metric_module import MetricModule
 
 
 class MetricLearner:
@@ -19,6 +24,7 @@ class MetricLearner:
         metric_module: MetricModule,
         num_iterations: int = 5,
         optimizer_class: Optional[Any] = None,
+        num_threads: Optional[int] = None,
         verbose: bool = False
     ):
         """
@@ -29,21 +35,37 @@ class MetricLearner:
             metric_module: The MetricModule instance to use for optimization
             num_iterations: Number of optimization iterations to run
             optimizer_class: Optional custom optimizer class (defaults to BootstrapFewShot)
+            num_threads: Number of threads the optimizer uses to call the metric
+                in parallel. Defaults to min(16, number of examples) for
+                optimizers that accept a num_threads argument (e.g.
+                BootstrapFewShotWithRandomSearch); passing it to an optimizer
+                without one raises TypeError.
             verbose: Whether to print detailed progress information
         """
         self.program = program
         self.metric_module = metric_module
         self.num_iterations = num_iterations
-        self.optimizer_class = optimizer_class or dspy.teleprompt.BootstrapFewShot
+        if optimizer_class is None:
+            import dspy
+            optimizer_class = dspy.teleprompt.BootstrapFewShot
+        self.optimizer_class = optimizer_class
+        self.num_threads = num_threads
         self.verbose = verbose
+        self._metric_fn = None
         
     def _create_metric_fn(self) -> Callable:
         """
         Create a metric function for the DSPy optimizer.
         
+        The function reads the metric module and verbosity from the learner
+        when it is called, so it is built once and reused.
+        
         Returns:
             Callable: A metric function compatible with DSPy optimizers
         """
+        if self._metric_fn is not None:
+            return self._metric_fn
+        
         def metric_fn(example, pred, trace=None):
             """
             Metric function for DSPy optimization.
@@ -77,6 +99,7 @@ class MetricLearner:
             
             return score
         
+        self._metric_fn = metric_fn
         return metric_fn
     
     def optimize(self, examples: List[dspy.Example]) -> dspy.Module:
@@ -94,9 +117,11 @@ class MetricLearner:
             print(f"Number of iterations: {self.num_iterations}")
         
         # Create the optimizer
+        # Each metric call is an LM request, so score examples concurrently
         optimizer = self.optimizer_class(
             metric=self._create_metric_fn(),
-            max_bootstrapped_demos=self.num_iterations
+            max_bootstrapped_demos=self.num_iterations,
+            **num_threads_kwargs(self.optimizer_class, len(examples), self.num_threads)
         )
         
         # Optimize the program
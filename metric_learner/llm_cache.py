@@ -0,0 +1,393 @@
+import os
+import json
+import time
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+try:
+    from typing import Protocol
+except ImportError:  # pragma: no cover - Python < 3.8
+    Protocol = object
+
+
+class CacheBackend(Protocol):
+    """
+    Storage interface used by LLMCache.
+
+    A backend maps string keys to JSON-serializable dictionaries.
+    """
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        ...
+
+    def delete(self, key: str) -> None:
+        ...
+
+
+class MemoryBackend:
+    """
+    In-memory cache backend with least-recently-used eviction.
+    """
+
+    def __init__(self, maxsize=1024):
+        """
+        Initialize the backend.
+
+        Args:
+            maxsize: Maximum number of entries to keep (None for unbounded)
+        """
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        # Metrics may be scored from several threads at once
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for a key, or None if it is missing."""
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entry if full."""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if self.maxsize is not None and len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """Remove a key from the cache if present."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class FileBackend:
+    """
+    On-disk cache backend storing one JSON file per key.
+
+    Files are sharded into subdirectories named after the first two
+    hex characters of the key to keep directory sizes small.
+    """
+
+    def __init__(self, cache_dir=os.path.join("~", ".cache", "metric_learner")):
+        """
+        Initialize the backend.
+
+        Args:
+            cache_dir: Directory in which to store cache entries
+        """
+        self.cache_dir = os.path.expanduser(cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Return the cached value for a key, or None if it is missing or unreadable."""
+        try:
+            with open(self._path(key), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, value):
+        """Store a value on disk."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial entry
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps(value))
+        os.replace(tmp_path, path)
+
+    def delete(self, key):
+        """Remove a key from the cache if present."""
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class LLMCache:
+    """
+    Deterministic response cache for MetricModule scores.
+
+    Entries are keyed by a SHA-256 hash of everything that determines the
+    prompt sent to the language model, plus the model identifier.
+    """
+
+    def __init__(self, backend=None):
+        """
+        Initialize the cache.
+
+        Args:
+            backend: Optional CacheBackend (defaults to a MemoryBackend)
+        """
+        self.backend = backend if backend is not None else MemoryBackend()
+
+    @staticmethod
+    def make_key(template, input, prediction, gold=None, model=None, demonstrations=None):
+        """
+        Build a cache key for a scoring request.
+
+        Args:
+            template: The prompt template
+            input: The input text
+            prediction: The prediction being scored
+            gold: Optional gold standard answer
+            model: Identifier of the language model
+            demonstrations: Optional list of few-shot examples
+
+        Returns:
+            str: Hex digest identifying the request
+        """
+        payload = {
+            "template": template,
+            "input": input,
+            "prediction": prediction,
+            "gold": gold,
+            "model": model,
+            "demonstrations": demonstrations or [],
+        }
+        encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def get(self, key):
+        """Return the cached entry for a key, or None on a miss."""
+        return self.backend.get(key)
+
+    def set(self, key, value):
+        """Store an entry for a key."""
+        self.backend.set(key, value)
+
+    def delete(self, key):
+        """Remove the entry for a key."""
+        self.backend.delete(key)
+
+    def __deepcopy__(self, memo):
+        # Copies of a module (e.g. made by optimizers) share its cache; keys
+        # include the demonstrations, so their entries never collide
+        return self
+
+
+class SemanticCache:
+    """
+    Similarity-based cache for scoring prompts.
+
+    Prompts are embedded and a cached value is returned when a previously
+    seen prompt has a cosine similarity of at least ``threshold``. This
+    catches near-duplicate requests (e.g. paraphrased inputs) that the
+    exact-match LLMCache misses.
+    """
+
+    def __init__(self, embedder, threshold=0.92, ttl=3600, maxsize=1024, embed_cache_size=4096):
+        """
+        Initialize the cache.
+
+        Args:
+            embedder: Callable mapping a string to a 1-D embedding vector,
+                e.g. dspy.Embedder or SentenceTransformer.encode
+            threshold: Minimum cosine similarity for a cache hit
+            ttl: Seconds after which entries expire (None to never expire)
+            maxsize: Maximum number of entries; the oldest entry is evicted first
+            embed_cache_size: Number of recent prompt embeddings to memoize
+        """
+        self.embedder = embedder
+        # Identical prompts are rendered repeatedly, so reuse their embeddings
+        self.embed_cache_size = embed_cache_size
+        self._embed_cached = functools.lru_cache(maxsize=embed_cache_size)(self._embed)
+        self.threshold = threshold
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._vectors = None
+        self._values = []
+        self._timestamps = []
+        self._lock = threading.Lock()
+
+    def embed(self, text):
+        """
+        Embed a prompt as a unit-length float32 vector.
+
+        Args:
+            text: The rendered prompt
+
+        Returns:
+            numpy.ndarray: Normalized, read-only embedding
+        """
+        return self._embed_cached(text)
+
+    def _embed(self, text):
+        vector = np.asarray(self.embedder(text), dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+        # The same array is returned for every repeated prompt
+        vector.setflags(write=False)
+        return vector
+
+    def _expire(self):
+        """Drop entries older than the TTL."""
+        if self.ttl is None or not self._timestamps:
+            return
+        cutoff = time.monotonic() - self.ttl
+        keep = [i for i, ts in enumerate(self._timestamps) if ts >= cutoff]
+        if len(keep) < len(self._timestamps):
+            self._vectors = self._vectors[keep] if keep else None
+            self._values = [self._values[i] for i in keep]
+            self._timestamps = [self._timestamps[i] for i in keep]
+
+    def query(self, embedding):
+        """
+        Look up the most similar cached entry.
+
+        Args:
+            embedding: Normalized embedding as returned by embed()
+
+        Returns:
+            dict: The cached value, or None if no entry is similar enough
+        """
+        with self._lock:
+            self._expire()
+            if self._vectors is None:
+                return None
+            # Vectors are normalized, so the inner product is the cosine similarity
+            similarities = self._vectors @ embedding
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                return self._values[best]
+            return None
+
+    def add(self, embedding, value):
+        """
+        Store a value for an embedding.
+
+        Args:
+            embedding: Normalized embedding as returned by embed()
+            value: JSON-serializable value to cache
+        """
+        row = embedding.reshape(1, -1)
+        with self._lock:
+            self._vectors = row if self._vectors is None else np.vstack([self._vectors, row])
+            self._values.append(value)
+            self._timestamps.append(time.monotonic())
+            if self.maxsize is not None and len(self._values) > self.maxsize:
+                self._vectors = self._vectors[1:]
+                self._values.pop(0)
+                self._timestamps.pop(0)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        del state["_embed_cached"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._embed_cached = functools.lru_cache(maxsize=self.embed_cache_size)(self._embed)
+
+
+def _is_caching_dspy_lm(lm):
+    """
+    Check whether an LM is a DSPy language model with dspy's response cache on.
+    
+    dspy.LM leaves the temperature unset (None) by default and still caches
+    its responses, so such LMs are cached here too.
+    """
+    # Imported here so that using the cache does not pull in dspy
+    import dspy
+    lm_class = getattr(dspy, "BaseLM", None) or getattr(dspy, "LM", None)
+    return isinstance(lm_class, type) and isinstance(lm, lm_class) and bool(getattr(lm, "cache", False))
+
+
+def _is_cacheable_temperature(lm, temperature):
+    """Check whether a temperature an LM declares allows caching its responses."""
+    if temperature is None:
+        return _is_caching_dspy_lm(lm)
+    return temperature == 0
+
+
+def is_deterministic(lm):
+    """
+    Check whether a language model produces repeatable output.
+
+    Models exposing a temperature (directly or via a ``kwargs`` dict, as
+    dspy.LM does) are deterministic only at temperature 0, or with the
+    temperature unset on a dspy.LM whose own cache is enabled. Plain
+    callables without a temperature, such as mock LMs, are treated as
+    deterministic.
+
+    Args:
+        lm: The language model
+
+    Returns:
+        bool: True if responses from the model may be cached
+    """
+    kwargs = getattr(lm, "kwargs", None)
+    if isinstance(kwargs, dict) and "temperature" in kwargs:
+        return _is_cacheable_temperature(lm, kwargs["temperature"])
+    temperature = getattr(lm, "temperature", None)
+    if isinstance(temperature, (int, float)):
+        return temperature == 0
+    return True
+
+
+def is_known_deterministic(lm):
+    """
+    Check whether a language model is known to produce repeatable output.
+    
+    Unlike is_deterministic(), LMs that say nothing about their sampling
+    are not assumed to be deterministic: the model must be named by a
+    string ``model`` attribute (as on dspy.LM) and run at temperature 0,
+    or be a dspy.LM left at its default temperature with dspy's own
+    response cache enabled, as ``dspy.LM("openai/...")`` is.
+    
+    Args:
+        lm: The language model
+        
+    Returns:
+        bool: True if responses from the model may be cached by default
+    """
+    if not isinstance(getattr(lm, "model", None), str):
+        return False
+    kwargs = getattr(lm, "kwargs", None)
+    if isinstance(kwargs, dict) and "temperature" in kwargs:
+        return _is_cacheable_temperature(lm, kwargs["temperature"])
+    temperature = getattr(lm, "temperature", None)
+    return isinstance(temperature, (int, float)) and temperature == 0
+
+
+def lm_model_id(lm):
+    """Return a stable identifier for a language model."""
+    model = getattr(lm, "model", None)
+    if isinstance(model, str):
+        return model
+    return type(lm).__qualname__
@@ -1,4 +1,73 @@
+import asyncio
+import functools
+import itertools
+import string
+
 import dspy
+from dspy.dsp.utils.settings import thread_local_overrides
+from dspy.utils.callback import with_callbacks
+from dspy.utils.usage_tracker import track_usage
+
+from ._fastparse import has_complete_score, parse_score
+from .llm_cache import LLMCache, is_deterministic, is_known_deterministic, lm_model_id
+
+
+# Fields that may be referenced in a prompt template
+TEMPLATE_FIELDS = ("input", "prediction", "gold")
+
+# Numbers LMs without a model name apart in cache keys
+_LM_NUMBERS = itertools.count()
+
+
+def _compile_template(template):
+    """
+    Rewrite a prompt template to use positional fields.
+    
+    The template is parsed once and its named fields are replaced with
+    positional indices into TEMPLATE_FIELDS, which str.format fills
+    considerably faster than keyword arguments.
+    
+    Args:
+        template: A str.format-style template
+        
+    Returns:
+        tuple: Equivalent template with positional fields, and the set of
+            field names it references
+        
+    Raises:
+        ValueError: If the template references an unknown field
+    """
+    compiled = ""
+    fields = set()
+    for literal, field, format_spec, conversion in string.Formatter().parse(template):
+        compiled += literal.replace("{", "{{").replace("}", "}}")
+        if field is None:
+            continue
+        if field not in TEMPLATE_FIELDS:
+            raise ValueError(
+                f"Unknown field '{{{field}}}' in prompt template; "
+                f"expected one of {', '.join(TEMPLATE_FIELDS)}"
+            )
+        fields.add(field)
+        compiled += "{" + str(TEMPLATE_FIELDS.index(field))
+        if conversion:
+            compiled += "!" + conversion
+        if format_spec:
+            compiled += ":" + format_spec
+        compiled += "}"
+    return compiled, fields
+
+
+def _normalize(text):
+    """Lowercase a string and collapse runs of whitespace."""
+    return " ".join(str(text).lower().split())
+
+
+def _is_dspy_lm(lm):
+    """Check whether an LM is a DSPy language model that accepts chat messages."""
+    lm_class = getattr(dspy, "BaseLM", None) or getattr(dspy, "LM", None)
+    return isinstance(lm_class, type) and isinstance(lm, lm_class)
+
 
 class MetricModule(dspy.Module):
     """
@@ -8,7 +77,8 @@ class MetricModule(dspy.Module):
     then uses a language model to generate a score between 0 and 1.
     """
     
-    def __init__(self, lm, demonstrations=None, prompt_template=None):
+    def __init__(self, lm, demonstrations=None, prompt_template=None, cache=None, semantic_cache=None,
+                 trivial_shortcircuit=False, on_error="default"):
         """
         Initialize the metric module.
         
@@ -16,18 +86,126 @@ class MetricModule(dspy.Module):
             lm: The language model to use for scoring
             demonstrations: Optional list of few-shot examples
             prompt_template: Optional custom prompt template
+            cache: LLMCache used to reuse scores for repeated requests. Defaults
+                to a new in-memory LLMCache that is only used while the LM is
+                known to be deterministic (a string ``model`` at temperature 0,
+                or a dspy.LM at its default temperature with dspy's cache on);
+                pass False to disable caching
+            semantic_cache: Optional SemanticCache consulted after the exact cache
+                to reuse scores for near-duplicate prompts
+            trivial_shortcircuit: If True, score predictions that match the gold
+                answer (ignoring case and whitespace) as 1.0 without calling the LM
+            on_error: 'default' to score failed LM calls as 0.5, or 'raise' to
+                propagate the exception
         """
+        if on_error not in ("default", "raise"):
+            raise ValueError(f"on_error must be 'default' or 'raise', got {on_error!r}")
         super().__init__()
         self.lm = lm
+        # Scores are only memoized by default for LMs known to be
+        # deterministic; an explicit cache is used for any LM without a
+        # nonzero temperature
+        self._default_cache = cache is None
+        if cache is None:
+            cache = LLMCache()
+        self.cache = cache or None
+        self.semantic_cache = semantic_cache
+        self.trivial_shortcircuit = trivial_shortcircuit
+        self.on_error = on_error
         self.demonstrations = demonstrations if demonstrations is not None else []
         
         if prompt_template is None:
-            self.prompt_template = (
-                "Rate the quality of the answer '{prediction}' for the question '{input}' "
-                "on a scale from 0 to 1, where 0 is completely incorrect and 1 is perfect."
+            # Static rubric first and dynamic fields last, so that every
+            # request shares the longest possible prompt prefix
+            prompt_template = (
+                "Rate the quality of the answer to the question below "
+                "on a scale from 0 to 1, where 0 is completely incorrect and 1 is perfect.\n\n"
+                "Question: {input}\n"
+                "Answer: {prediction}"
             )
-        else:
-            self.prompt_template = prompt_template
+        self.prompt_template = prompt_template
+    
+    def dump_state(self, json_mode=True):
+        """
+        Return the learnable state of the module.
+        
+        The prompt template and demonstrations are included, so that
+        dspy's ``save()`` / ``load()`` persist an optimized metric.
+        """
+        state = super().dump_state(json_mode=json_mode)
+        state["prompt_template"] = self.prompt_template
+        state["demonstrations"] = [dict(demo) for demo in self.demonstrations]
+        return state
+    
+    def load_state(self, state, **kwargs):
+        """Restore state produced by dump_state()."""
+        self.prompt_template = state.get("prompt_template", self.prompt_template)
+        self.demonstrations = [dict(demo) for demo in state.get("demonstrations", [])]
+        return super().load_state(state, **kwargs)
+    
+    @property
+    def demonstrations(self):
+        """
+        Few-shot examples included in every prompt.
+        
+        The rendered prompt prefix is cached and re-rendered whenever the
+        demonstrations differ from the ones it was rendered from, including
+        changes made in place.
+        """
+        return self._demonstrations
+    
+    @demonstrations.setter
+    def demonstrations(self, demonstrations):
+        self._demonstrations = demonstrations
+        self._prefix = None
+    
+    @property
+    def lm(self):
+        """The language model used for scoring."""
+        return self._lm
+    
+    @lm.setter
+    def lm(self, lm):
+        self._lm = lm
+        model = lm_model_id(lm)
+        if not isinstance(getattr(lm, "model", None), str):
+            # A type name does not tell two callables apart, so every LM
+            # assigned gets its own keys and never sees another LM's scores
+            model = f"{model}#{next(_LM_NUMBERS)}"
+        self._lm_key = model
+    
+    @property
+    def prompt_template(self):
+        """The str.format-style template used for each scoring request."""
+        return self._prompt_template
+    
+    @prompt_template.setter
+    def prompt_template(self, template):
+        # Parse the template once instead of on every request
+        self._compiled_template, fields = _compile_template(template)
+        self._template_uses_gold = "gold" in fields
+        self._prompt_template = template
+
+    @with_callbacks
+    def __call__(self, *args, **kwargs):
+        """Score a prediction; see forward()."""
+        # Mirrors dspy.Module.__call__, which looks up ``self.forward``: dspy's
+        # __getattribute__ calls inspect.stack() on every such lookup, costing
+        # milliseconds per score, far more than a cache hit. Forward is called
+        # through the class instead, keeping the callbacks, caller modules and
+        # usage tracking dspy wraps around it.
+        forward = type(self).forward
+        caller_modules = list(dspy.settings.caller_modules or [])
+        caller_modules.append(self)
+        
+        with dspy.settings.context(caller_modules=caller_modules):
+            if dspy.settings.track_usage and thread_local_overrides.get().get("usage_tracker") is None:
+                with track_usage() as usage_tracker:
+                    output = forward(self, *args, **kwargs)
+                self._set_lm_usage(usage_tracker.get_total_tokens(), output)
+                return output
+            
+            return forward(self, *args, **kwargs)
 
     def forward(self, input, prediction, gold=None):
         """
@@ -45,47 +223,199 @@ class MetricModule(dspy.Module):
             # Check for None inputs
             if input is None or prediction is None:
                 return 0.5
+            
+            # An exact match of the gold answer needs no LM judgement
+            if self.trivial_shortcircuit and gold is not None and _normalize(prediction) == _normalize(gold):
+                return 1.0
                 
-            # Build prompt with demonstrations (if any)
-            prompt = self._build_prompt(input, prediction, gold)
+            # Reuse a cached score if this exact request was seen before
+            cache_key = self._cache_key(input, prediction, gold)
+            if cache_key is not None:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    return cached["score"]
             
+            # Fall back to a similar prompt seen before
+            embedding = None
+            if self.semantic_cache is not None and is_deterministic(self.lm):
+                embedding = self.semantic_cache.embed(self._build_prompt(input, prediction, gold))
+                cached = self.semantic_cache.query(embedding)
+                if cached is not None:
+                    return cached["score"]
+                
             # Query the language model
-            response = self.lm(prompt)
+            response = self._query_lm(input, prediction, gold)
             score = self._parse_score(response)
+            
+            if cache_key is not None:
+                self.cache.set(cache_key, {"score": score})
+            if embedding is not None:
+                self.semantic_cache.add(embedding, {"score": score})
             return score
-        except Exception as e:
+        except Exception:
+            if self.on_error == "raise":
+                raise
             # If any error occurs, return a default score of 0.5
             return 0.5
     
-    def _build_prompt(self, input, prediction, gold=None):
-        """Build the prompt with optional demonstrations and gold standard."""
-        prompt = ""
+    async def abatch(self, examples, max_concurrency=16):
+        """
+        Score several predictions concurrently.
+        
+        LM calls are I/O bound, so up to ``max_concurrency`` requests are kept
+        in flight at once instead of being issued one after another.
+        
+        Args:
+            examples: List of dicts with 'input', 'prediction' and optional 'gold' keys
+            max_concurrency: Maximum number of concurrent LM calls
+            
+        Returns:
+            list: Scores in the same order as the examples
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def score(example):
+            async with semaphore:
+                return await self._ascore(
+                    example.get("input"),
+                    example.get("prediction"),
+                    gold=example.get("gold")
+                )
+        
+        return list(await asyncio.gather(*[score(example) for example in examples]))
+    
+    async def _ascore(self, input, prediction, gold=None):
+        """Run a single forward pass in a worker thread."""
+        # dspy.asyncify propagates the caller's dspy settings to the worker thread
+        if hasattr(dspy, "asyncify"):
+            return await dspy.asyncify(self)(input, prediction, gold=gold)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(self, input, prediction, gold=gold))
+    
+    def _cache_key(self, input, prediction, gold=None):
+        """Return the cache key for a request, or None if caching is disabled."""
+        if self.cache is None or not is_deterministic(self.lm):
+            return None
+        if self._default_cache and not is_known_deterministic(self.lm):
+            return None
+        # The rendered prefix already encodes the demonstrations, so it is
+        # hashed instead of re-serializing them on every call
+        return self.cache.make_key(
+            self._build_prefix() + self.prompt_template,
+            input,
+            prediction,
+            gold=gold,
+            model=self._lm_key
+        )
+    
+    def _build_prefix(self):
+        """
+        Build the static part of the prompt.
+        
+        The prefix only depends on the demonstrations, so it is identical for
+        every request and can be served from provider-side prompt caches. It
+        is rendered once and reused until the demonstrations change.
+        """
+        # Comparing a snapshot of every field also catches demonstrations
+        # that were replaced or edited in place
+        snapshot = tuple(tuple(demo.items()) for demo in self._demonstrations)
+        if self._prefix is None or snapshot != self._prefix_snapshot:
+            self._prefix = self._render_prefix()
+            self._prefix_snapshot = snapshot
+        return self._prefix
+    
+    def _render_prefix(self):
+        """Render the demonstrations and output instruction."""
+        # Collect the fragments and join once, instead of growing a string
+        parts = []
         
         # Add demonstrations if available
         if self.demonstrations:
-            prompt += "Here are some examples of how to rate answers:\n\n"
+            parts.append("Here are some examples of how to rate answers:\n\n")
             for demo in self.demonstrations:
-                prompt += f"Question: {demo['input']}\n"
-                prompt += f"Answer: {demo['prediction']}\n"
+                parts.append(f"Question: {demo['input']}\n")
+                parts.append(f"Answer: {demo['prediction']}\n")
                 if 'gold' in demo and demo['gold']:
-                    prompt += f"Correct answer: {demo['gold']}\n"
+                    parts.append(f"Correct answer: {demo['gold']}\n")
                 # Use 'score' or 'user_score' key, whichever is available
                 score_key = 'score' if 'score' in demo else 'user_score'
-                prompt += f"Rating: {demo[score_key]}\n\n"
-            
-            prompt += "Now, rate the following answer:\n\n"
+                parts.append(f"Rating: {demo[score_key]}\n\n")
+        
+        # Add the output instruction
+        parts.append("Provide only a number between 0 and 1 as your response.\n\n")
+        
+        if self.demonstrations:
+            parts.append("Now, rate the following answer:\n\n")
+        
+        return "".join(parts)
+    
+    def _build_suffix(self, input, prediction, gold=None):
+        """Build the request-specific part of the prompt."""
+        suffix = self._compiled_template.format(input, prediction, gold)
         
-        # Add the main prompt
-        prompt += self.prompt_template.format(input=input, prediction=prediction)
+        # Add gold standard if available and not already part of the template
+        if gold and not self._template_uses_gold:
+            suffix += f"\nCorrect answer: {gold}"
         
-        # Add gold standard if available
-        if gold:
-            prompt += f" The correct answer is '{gold}'."
+        return suffix
+    
+    def _build_prompt(self, input, prediction, gold=None):
+        """Build the prompt with optional demonstrations and gold standard."""
+        return self._build_prefix() + self._build_suffix(input, prediction, gold)
+    
+    def _query_lm(self, input, prediction, gold=None):
+        """
+        Send a scoring request to the language model.
         
-        # Add final instruction
-        prompt += "\n\nProvide only a number between 0 and 1 as your response."
+        dspy.LM instances receive the static prefix as a separate system
+        message. LMs with a ``stream`` method are streamed and cut off as
+        soon as the score has arrived; any other callable receives the full
+        prompt string.
         
-        return prompt
+        Returns:
+            str: The LM's response text
+        """
+        if _is_dspy_lm(self.lm):
+            response = self.lm(messages=[
+                {"role": "system", "content": self._build_prefix()},
+                {"role": "user", "content": self._build_suffix(input, prediction, gold)},
+            ])
+        elif callable(getattr(type(self.lm), "stream", None)):
+            response = self._stream_lm(self._build_prompt(input, prediction, gold))
+        else:
+            response = self.lm(self._build_prompt(input, prediction, gold))
+        
+        # dspy.LM returns a list of completions
+        if isinstance(response, list):
+            response = response[0]
+        return response
+
+    def _stream_lm(self, prompt):
+        """
+        Stream a response and stop reading once it contains a complete score.
+        
+        Verbose models may reason before or after the number; closing the
+        stream early avoids waiting for (and paying for) those tokens.
+        
+        Args:
+            prompt: The full prompt string
+            
+        Returns:
+            str: The response text received before the stream was closed
+        """
+        stream = self.lm.stream(prompt)
+        response = ""
+        try:
+            for chunk in stream:
+                response += chunk
+                if has_complete_score(response):
+                    break
+        finally:
+            # Closing the stream cancels generation for generator-based clients
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+        return response
 
     def _parse_score(self, response):
         """
@@ -97,25 +427,8 @@ class MetricModule(dspy.Module):
         Returns:
             float: A score between 0 and 1
         """
-        # Try to extract a float from the response
         try:
-            # Clean the response and extract the first number
-            cleaned = response.strip()
-            
-            # Look for a decimal number in the response (including negative numbers)
-            import re
-            match = re.search(r'(-?\d+\.\d+|-?\d+)', cleaned)
-            if match:
-                score = float(match.group(1))
-                # Ensure the score is between 0 and 1
-                if score < 0.0:
-                    return 0.0
-                elif score > 1.0:
-                    return 1.0
-                return score
-            else:
-                # If no number is found, return a default score
-                return 0.5
+            return parse_score(response)
         except Exception:
             # If parsing fails, return a default score
             return 0.5
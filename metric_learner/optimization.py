@@ -1,6 +1,18 @@
-import dspy
+import os
+import json
+import hashlib
+import inspect
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
+from .data_manager import LabeledArrays
+from .llm_cache import lm_model_id
+
+# Upper bound on the default number of evaluation threads
+MAX_DEFAULT_THREADS = 16
+
 def get_labeled_dataset(data_manager):
     """
     Get a labeled dataset from a data manager.
@@ -29,7 +41,63 @@ def mse_metric(example, pred, trace=None):
     user_score = example.user_score
     return -(predicted_score - user_score) ** 2
 
-def optimize_metric_module(metric_module, dataset, metric_fn=None, optimizer_class=None):
+def _accepts_argument(cls, name):
+    """Check whether a class constructor accepts a keyword argument."""
+    try:
+        parameters = inspect.signature(cls).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    return any(p.name == name or p.kind == p.VAR_KEYWORD for p in parameters)
+
+def num_threads_kwargs(optimizer_class, num_examples, num_threads=None):
+    """
+    Choose the num_threads argument for a DSPy optimizer.
+    
+    Args:
+        optimizer_class: The optimizer class to construct
+        num_examples: Number of examples the optimizer evaluates
+        num_threads: Explicit thread count, or None for the default of
+            min(16, num_examples) when the optimizer accepts num_threads
+        
+    Returns:
+        dict: Keyword arguments to add to the optimizer's constructor
+    """
+    if num_threads is not None:
+        return {"num_threads": num_threads}
+    if _accepts_argument(optimizer_class, "num_threads"):
+        return {"num_threads": max(1, min(MAX_DEFAULT_THREADS, num_examples))}
+    return {}
+
+def deduplicate_dataset(dataset):
+    """
+    Remove repeated examples from a labeled dataset.
+    
+    Examples are duplicates when their input, prediction, gold answer and
+    user score (rounded to 3 decimals) are equal; the first one is kept.
+    
+    Args:
+        dataset: List of dspy.Example objects with user scores
+        
+    Returns:
+        list: The unique examples in their original order
+    """
+    seen = set()
+    deduplicated = []
+    for example in dataset:
+        user_score = example.get("user_score")
+        key = (
+            example.get("input"),
+            example.get("prediction"),
+            example.get("gold"),
+            round(user_score, 3) if user_score is not None else None
+        )
+        if key in seen:
+            continue
+        seen.add(key)
+        deduplicated.append(example)
+    return deduplicated
+
+def optimize_metric_module(metric_module, dataset, metric_fn=None, optimizer_class=None, num_threads=None):
     """
     Optimize a metric module using labeled data.
     
@@ -38,6 +106,10 @@ def optimize_metric_module(metric_module, dataset, metric_fn=None, optimizer_cla
         dataset: List of dspy.Example objects with user scores
         metric_fn: Optional custom metric function
         optimizer_class: Optional custom optimizer class
+        num_threads: Number of threads the optimizer uses to evaluate the metric
+            in parallel. Defaults to min(16, len(dataset)) for optimizers that
+            accept a num_threads argument (e.g. BootstrapFewShotWithRandomSearch,
+            MIPROv2); passing it to an optimizer without one raises TypeError.
         
     Returns:
         MetricModule: Optimized metric module
@@ -46,16 +118,26 @@ def optimize_metric_module(metric_module, dataset, metric_fn=None, optimizer_cla
         print("No labeled data available for optimization.")
         return metric_module
     
+    # Duplicates cost optimizer LM calls without adding information
+    deduplicated = deduplicate_dataset(dataset)
+    if len(deduplicated) < len(dataset):
+        print(f"Removed {len(dataset) - len(deduplicated)} duplicate examples.")
+        dataset = deduplicated
+    
     # Use default metric function if none provided
     if metric_fn is None:
         metric_fn = mse_metric
     
     # Use default optimizer if none provided
     if optimizer_class is None:
+        import dspy
         optimizer_class = dspy.teleprompt.BootstrapFewShot
     
     # Create and configure the optimizer
-    optimizer = optimizer_class(metric=metric_fn)
+    optimizer = optimizer_class(
+        metric=metric_fn,
+        **num_threads_kwargs(optimizer_class, len(dataset), num_threads)
+    )
     
     # Compile the metric module
     print(f"Optimizing metric module with {len(dataset)} labeled examples...")
@@ -65,73 +147,249 @@ def optimize_metric_module(metric_module, dataset, metric_fn=None, optimizer_cla
     print("Optimization complete.")
     return optimized_module
 
+def hash_trainset(dataset):
+    """
+    Compute a fingerprint of a training set.
+    
+    The hash does not depend on the order of the examples, so reloading the
+    same labels from disk produces the same fingerprint.
+    
+    Args:
+        dataset: List of dspy.Example objects
+        
+    Returns:
+        str: SHA-256 hex digest of the examples
+    """
+    records = sorted(json.dumps(example.toDict(), sort_keys=True, default=str) for example in dataset)
+    return hashlib.sha256("\n".join(records).encode()).hexdigest()
+
+def _pearson(user_scores, model_scores):
+    """
+    Compute the Pearson correlation of two score arrays.
+    
+    The centered arrays are reused for both the variance check and the
+    correlation, instead of letting np.std and np.corrcoef each recompute
+    the means.
+    
+    Args:
+        user_scores: Float64 array of user scores
+        model_scores: Float64 array of model scores in the same order
+        
+    Returns:
+        float: The correlation, or 0.0 if either array has no variance
+    """
+    user_centered = user_scores - user_scores.mean()
+    model_centered = model_scores - model_scores.mean()
+    user_ss = np.dot(user_centered, user_centered)
+    model_ss = np.dot(model_centered, model_centered)
+    # Avoid division by zero when all scores are equal
+    if user_ss <= 0 or model_ss <= 0:
+        return 0.0
+    correlation = np.dot(user_centered, model_centered) / (np.sqrt(user_ss) * np.sqrt(model_ss))
+    # Rounding can push the result just outside [-1, 1]
+    return float(min(1.0, max(-1.0, correlation)))
+
+def _qualified_name(obj):
+    """Return the dotted name of a function or class, or of an object's class."""
+    if not hasattr(obj, "__qualname__"):
+        obj = type(obj)
+    return f"{obj.__module__}.{obj.__qualname__}"
+
+def _hash_optimization_config(metric_module, optimize_kwargs):
+    """
+    Compute a fingerprint of everything besides the data that shapes an optimization run.
+    
+    Args:
+        metric_module: MetricModule instance to optimize
+        optimize_kwargs: Keyword arguments for optimize_metric_module(),
+            e.g. metric_fn and optimizer_class
+        
+    Returns:
+        str: SHA-256 hex digest of the module's state and LM, and of the
+            optimizer arguments (functions and classes by name)
+    """
+    config = {
+        "state": metric_module.dump_state(),
+        "lm": lm_model_id(metric_module.lm),
+        "optimize_kwargs": optimize_kwargs,
+    }
+    encoded = json.dumps(config, sort_keys=True, default=_qualified_name)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+def load_or_optimize_metric_module(metric_module, dataset, cache_dir, name="metric", **kwargs):
+    """
+    Reuse a previously optimized metric module, or optimize and save one.
+    
+    Optimized modules are stored as JSON (via dspy's save()) in
+    ``cache_dir/<name>_<trainset hash>_<config hash>.json``. The config hash
+    covers the module's prompt template and demonstrations, its LM, and the
+    optimizer arguments, so changing any of them or the training set
+    triggers a new optimization run.
+    
+    Args:
+        metric_module: MetricModule instance to optimize
+        dataset: List of dspy.Example objects with user scores
+        cache_dir: Directory in which optimized modules are stored
+        name: Name used in the file name, e.g. the metric name
+        **kwargs: Additional arguments passed to optimize_metric_module()
+        
+    Returns:
+        MetricModule: Optimized metric module
+    """
+    if not dataset:
+        return optimize_metric_module(metric_module, dataset, **kwargs)
+    
+    config_hash = _hash_optimization_config(metric_module, kwargs)
+    path = os.path.join(cache_dir, f"{name}_{hash_trainset(dataset)[:16]}_{config_hash[:16]}.json")
+    if os.path.exists(path):
+        print(f"Loading optimized metric module from {path}")
+        optimized_module = metric_module.deepcopy()
+        optimized_module.load(path)
+        return optimized_module
+    
+    optimized_module = optimize_metric_module(metric_module, dataset, **kwargs)
+    os.makedirs(cache_dir, exist_ok=True)
+    optimized_module.save(path)
+    return optimized_module
+
 
 class MetricEvaluator:
     """
     Evaluates the performance of a metric module against user scores.
     """
     
-    def __init__(self, metric_module, data_manager):
+    def __init__(self, metric_module, data_manager, num_threads=None):
         """
         Initialize the evaluator.
         
         Args:
             metric_module: MetricModule instance
             data_manager: MetricDataManager instance
+            num_threads: Number of examples scored concurrently. LM calls are
+                I/O bound, so this defaults to min(16, number of examples);
+                pass 1 to score serially.
         """
         self.metric_module = metric_module
         self.data_manager = data_manager
+        self.num_threads = num_threads
     
-    def evaluate(self):
+    def _score_all(self, columns):
         """
-        Evaluate the metric module against labeled data.
+        Score every example once, in parallel threads.
         
+        Args:
+            columns: LabeledArrays of the examples to score
+            
         Returns:
-            dict: Evaluation metrics
+            numpy.ndarray: Float64 model scores in the same order as the examples
         """
-        # Get labeled data
-        dataset = self.data_manager.get_labeled_dataset()
+        num_threads = self.num_threads
+        if num_threads is None:
+            num_threads = min(MAX_DEFAULT_THREADS, len(columns))
+        rows = zip(columns.inputs, columns.predictions, columns.golds)
+        
+        def score(row):
+            input, prediction, gold = row
+            return self.metric_module(input, prediction, gold=gold)
+        
+        # Scores are written straight into a pre-sized array
+        model_scores = np.empty(len(columns), dtype=np.float64)
+        
+        if num_threads <= 1:
+            for i, row in enumerate(rows):
+                model_scores[i] = score(row)
+            return model_scores
+        
+        # Each call runs in a copy of the caller's context so that settings
+        # such as dspy.context(lm=...) apply inside the worker threads
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            results = executor.map(lambda row: contextvars.copy_context().run(score, row), rows)
+            for i, result in enumerate(results):
+                model_scores[i] = result
+        return model_scores
+    
+    def _labeled_columns(self):
+        """
+        Get the labeled examples as columns.
+        
+        Returns:
+            LabeledArrays: The labeled examples, or None if there are none
+        """
+        # Skip the conversion when nothing is labeled
+        if not self.data_manager.has_labeled():
+            dataset = []
+        else:
+            dataset = self.data_manager.get_labeled_dataset()
         
         if not dataset:
             print("No labeled data available for evaluation.")
-            return {}
+            return None
+        return LabeledArrays.from_examples(dataset)
+    
+    def _compute_metrics(self, user_scores, model_scores):
+        """
+        Compare model scores with user scores.
         
-        # Calculate metrics
-        errors = []
-        for example in dataset:
-            # Get model prediction
-            pred_score = self.metric_module(
-                example.input, 
-                example.prediction, 
-                gold=example.gold
-            )
+        Args:
+            user_scores: Float64 array of user scores
+            model_scores: Float64 array of model scores in the same order
             
-            # Calculate error
-            error = pred_score - example.user_score
-            errors.append(error)
-        
-        # Convert to numpy array
-        errors = np.array(errors)
-        
-        # Calculate metrics
+        Returns:
+            dict: Evaluation metrics
+        """
+        # Calculate metrics from one error array; the squared errors are
+        # summed with a dot product instead of materializing errors ** 2
+        n = len(user_scores)
+        errors = model_scores - user_scores
+        abs_errors = np.abs(errors, out=errors)
         metrics = {
-            "mse": float(np.mean(errors ** 2)),
-            "mae": float(np.mean(np.abs(errors))),
-            "max_error": float(np.max(np.abs(errors))),
-            "num_examples": len(dataset)
+            "mse": float(np.dot(abs_errors, abs_errors)) / n,
+            "mae": float(abs_errors.sum()) / n,
+            "max_error": float(abs_errors.max()),
+            "num_examples": n
         }
         
         # Only calculate correlation if we have more than one example
-        if len(dataset) > 1:
-            user_scores = np.array([e.user_score for e in dataset])
-            model_scores = np.array([self.metric_module(e.input, e.prediction, gold=e.gold) for e in dataset])
-            
-            # Check if there's variance in both arrays to avoid division by zero
-            if np.std(user_scores) > 0 and np.std(model_scores) > 0:
-                metrics["correlation"] = float(np.corrcoef(user_scores, model_scores)[0, 1])
-            else:
-                metrics["correlation"] = 0.0
-        else:
-            metrics["correlation"] = 0.0
+        metrics["correlation"] = _pearson(user_scores, model_scores) if n > 1 else 0.0
         
         return metrics
+    
+    def evaluate(self):
+        """
+        Evaluate the metric module against labeled data.
+        
+        Returns:
+            dict: Evaluation metrics
+        """
+        columns = self._labeled_columns()
+        if columns is None:
+            return {}
+        
+        # Score every example once
+        model_scores = self._score_all(columns)
+        return self._compute_metrics(columns.user_scores, model_scores)
+    
+    async def aevaluate(self, max_concurrency=16):
+        """
+        Evaluate the metric module against labeled data from async code.
+        
+        Examples are scored with the metric module's abatch(), keeping up to
+        ``max_concurrency`` LM calls in flight without blocking the event loop.
+        
+        Args:
+            max_concurrency: Maximum number of concurrent LM calls
+            
+        Returns:
+            dict: Evaluation metrics
+        """
+        columns = self._labeled_columns()
+        if columns is None:
+            return {}
+        
+        examples = [
+            {"input": input, "prediction": prediction, "gold": gold}
+            for input, prediction, gold in zip(columns.inputs, columns.predictions, columns.golds)
+        ]
+        scores = await self.metric_module.abatch(examples, max_concurrency=max_concurrency)
+        model_scores = np.asarray(scores, dtype=np.float64)
+        return self._compute_metrics(columns.user_scores, model_scores)
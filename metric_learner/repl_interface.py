@@ -1,3 +1,65 @@
+from collections import deque
+
+# Shown at the start of a session and by the 'help' command
+_HELP = (
+    "Enter a score between 0 and 1, or one of the following commands:\n"
+    "  skip: Skip this instance\n"
+    "  exit: Exit the labeling session\n"
+    "  help: Show this help message\n"
+    "Separate several answers with spaces to label ahead."
+)
+
+# Scores entered most often, looked up without parsing
+_COMMON_SCORES = {"0": 0.0, "1": 1.0, "0.5": 0.5, "0.0": 0.0, "1.0": 1.0}
+
+
+def _read_answer(pending):
+    """
+    Return the next answer typed by the user.
+    
+    Several answers may be entered on one line, separated by spaces, to
+    label the following instances ahead of time. Queued answers are used
+    before prompting again.
+    
+    Args:
+        pending: deque of answers typed ahead
+        
+    Returns:
+        str: The next answer, lowercased
+    """
+    if pending:
+        return pending.popleft()
+    answers = input("\nYour score (0-1, skip, exit, help): ").strip().lower().split()
+    if not answers:
+        return ""
+    pending.extend(answers[1:])
+    return answers[0]
+
+
+def _format_instance(instance, idx, total):
+    """
+    Render an instance for display.
+    
+    Args:
+        instance: Instance dict
+        idx: 1-based position of the instance in the session
+        total: Number of instances in the session
+        
+    Returns:
+        str: The instance header and fields, one per line
+    """
+    lines = [
+        f"\n--- Instance {idx}/{total} ---",
+        f"Input: {instance['input']}",
+        f"Prediction: {instance['prediction']}",
+    ]
+    if instance.get("gold"):
+        lines.append(f"Gold: {instance['gold']}")
+    if instance.get("score") is not None:
+        lines.append(f"Model score: {instance['score']}")
+    return "\n".join(lines)
+
+
 def label_instances(data_manager):
     """
     Interactive REPL for labeling instances with user scores.
@@ -7,67 +69,70 @@ def label_instances(data_manager):
     Args:
         data_manager: MetricDataManager instance
     """
-    # Load instances
-    instances = data_manager.load_instances()
+    # Count instances up front; unlabeled ones are streamed one at a time
+    total = data_manager.count_instances()
+    unlabeled_count = data_manager.count_unlabeled()
     
-    # Filter for unlabeled instances
-    unlabeled = [i for i in instances if i.get("user_score") is None]
-    
-    if not unlabeled:
+    if not unlabeled_count:
         print("No unlabeled instances found.")
         return
     
-    print(f"Found {len(unlabeled)} unlabeled instances for metric '{data_manager.metric_name}'.")
-    print("Enter a score between 0 and 1, or one of the following commands:")
-    print("  skip: Skip this instance")
-    print("  exit: Exit the labeling session")
-    print("  help: Show this help message")
+    # Track progress in memory instead of reloading the instances at the end
+    initial_labeled = total - unlabeled_count
+    newly_labeled = 0
+    
+    print(f"Found {unlabeled_count} unlabeled instances for metric '{data_manager.metric_name}'.")
+    print(_HELP)
     print()
     
-    for idx, instance in enumerate(unlabeled):
-        print(f"\n--- Instance {idx+1}/{len(unlabeled)} ---")
-        print(f"Input: {instance['input']}")
-        print(f"Prediction: {instance['prediction']}")
-        
-        if instance.get("gold"):
-            print(f"Gold: {instance['gold']}")
-            
-        if instance.get("score") is not None:
-            print(f"Model score: {instance['score']}")
-        
-        while True:
-            user_input = input("\nYour score (0-1, skip, exit, help): ").strip().lower()
+    # Answers typed ahead for the following instances
+    pending = deque()
+    
+    try:
+        for idx, instance in enumerate(data_manager.iter_unlabeled(), 1):
+            # Render the instance with a single write
+            print(_format_instance(instance, idx, unlabeled_count))
             
-            if user_input == "skip":
-                print("Skipping to next instance.")
-                break
-                
-            elif user_input == "exit":
-                print("Exiting labeling session.")
-                return
-                
-            elif user_input == "help":
-                print("Enter a score between 0 and 1, or one of the following commands:")
-                print("  skip: Skip this instance")
-                print("  exit: Exit the labeling session")
-                print("  help: Show this help message")
-                continue
+            while True:
+                user_input = _read_answer(pending)
                 
-            try:
-                user_score = float(user_input)
-                if 0 <= user_score <= 1:
-                    # Update the instance with the user score
-                    success = data_manager.update_user_score(instance["datetime"], user_score)
-                    if success:
-                        print(f"Score {user_score} saved.")
-                    else:
-                        print("Failed to save score. Please try again.")
+                if user_input == "skip":
+                    print("Skipping to next instance.")
                     break
-                else:
-                    print("Score must be between 0 and 1. Please try again.")
-            except ValueError:
-                print("Invalid input. Please enter a number between 0 and 1, or 'skip', 'exit', or 'help'.")
+                    
+                elif user_input == "exit":
+                    print("Exiting labeling session.")
+                    return
+                    
+                elif user_input == "help":
+                    print(_HELP)
+                    continue
+                    
+                try:
+                    user_score = _COMMON_SCORES.get(user_input)
+                    if user_score is None:
+                        user_score = float(user_input)
+                    if 0 <= user_score <= 1:
+                        # Update the instance with the user score
+                        success = data_manager.update_user_score_in_place(instance, user_score)
+                        if success:
+                            newly_labeled += 1
+                            print(f"Score {user_score} saved.")
+                        else:
+                            print("Failed to save score. Please try again.")
+                        break
+                    else:
+                        # Answers typed after a mistake may be meant for this instance
+                        pending.clear()
+                        print("Score must be between 0 and 1. Please try again.")
+                except ValueError:
+                    pending.clear()
+                    print("Invalid input. Please enter a number between 0 and 1, or 'skip', 'exit', or 'help'.")
+    finally:
+        if newly_labeled:
+            # Fold this session's score updates into their instances
+            data_manager.compact_log()
     
     print("\nLabeling session complete.")
-    labeled_count = len([i for i in instances if i.get("user_score") is not None])
-    print(f"You have labeled {labeled_count}/{len(instances)} instances for metric '{data_manager.metric_name}'.")
+    labeled_count = initial_labeled + newly_labeled
+    print(f"You have labeled {labeled_count}/{total} instances for metric '{data_manager.metric_name}'.")
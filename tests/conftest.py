@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Add the parent directory to the path to import the package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
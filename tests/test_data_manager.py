@@ -1,20 +1,21 @@
-import sys
 import os
 import unittest
 import tempfile
-import shutil
 import json
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+import numpy as np
 
-# Add the parent directory to the path to import the package
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-
+from metric_learner import data_manager as data_manager_module
 from metric_learner.data_manager import MetricDataManager
 
 class TestDataManager(unittest.TestCase):
     def setUp(self):
-        # Create a temporary directory for testing
-        self.test_dir = tempfile.mkdtemp()
+        # Create a temporary directory for testing, in RAM where available
+        tmp = tempfile.TemporaryDirectory(dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+        self.addCleanup(tmp.cleanup)
+        self.test_dir = tmp.name
         
         # Create a data manager with the test directory
         self.data_manager = MetricDataManager(
@@ -22,10 +23,6 @@ class TestDataManager(unittest.TestCase):
             data_dir=self.test_dir
         )
     
-    def tearDown(self):
-        # Remove the temporary directory
-        shutil.rmtree(self.test_dir)
-    
     def test_initialization(self):
         """Test that the data manager initializes correctly."""
         self.assertEqual(self.data_manager.metric_name, "test_metric")
@@ -34,20 +31,21 @@ class TestDataManager(unittest.TestCase):
     def test_save_instance(self):
         """Test saving an instance."""
         # Save an instance
-        filename = self.data_manager.save_instance(
+        datetime_str = self.data_manager.save_instance(
             input="What is 2+2?",
             prediction="4",
             gold="4",
             score=0.9
         )
         
-        # Check that the file exists
-        self.assertTrue(os.path.exists(filename))
+        # Check that the log exists
+        self.assertTrue(os.path.exists(self.data_manager.log_path))
         
-        # Check the contents of the file
-        with open(filename, "r") as f:
-            instance = json.load(f)
+        # Check the contents of the log
+        with open(self.data_manager.log_path, "r") as f:
+            instance = json.loads(f.readline())
         
+        self.assertEqual(instance["datetime"], datetime_str)
         self.assertEqual(instance["input"], "What is 2+2?")
         self.assertEqual(instance["prediction"], "4")
         self.assertEqual(instance["gold"], "4")
@@ -135,6 +133,31 @@ class TestDataManager(unittest.TestCase):
         self.assertEqual(example.gold, "A1")
         self.assertEqual(example.user_score, 0.8)
     
+    def test_get_labeled_arrays(self):
+        """Test getting labeled instances as parallel columns."""
+        self.data_manager.save_instance("Q1", "A1", gold="G1", score=0.5)
+        self.data_manager.save_instance("Q2", "A2", score=0.6)
+        self.data_manager.save_instance("Q3", "A3", score=0.7)
+        instances = self.data_manager.load_instances()
+        self.data_manager.update_user_score(instances[0]["datetime"], 0.8)
+        self.data_manager.update_user_score(instances[2]["datetime"], 0.3)
+        
+        arrays = self.data_manager.get_labeled_arrays()
+        
+        self.assertEqual(len(arrays), 2)
+        self.assertEqual(arrays.inputs, ["Q1", "Q3"])
+        self.assertEqual(arrays.predictions, ["A1", "A3"])
+        self.assertEqual(arrays.golds, ["G1", None])
+        self.assertEqual(arrays.user_scores.dtype, np.float64)
+        self.assertEqual(arrays.user_scores.tolist(), [0.8, 0.3])
+    
+    def test_get_labeled_arrays_empty(self):
+        """Test getting labeled columns when nothing is labeled."""
+        self.data_manager.save_instance("Q1", "A1", score=0.5)
+        arrays = self.data_manager.get_labeled_arrays()
+        self.assertEqual(len(arrays), 0)
+        self.assertEqual(arrays.inputs, [])
+    
     def test_load_instances_with_corrupt_file(self):
         """Test loading instances when there's a corrupt JSON file."""
         # Create a corrupt JSON file
@@ -151,11 +174,8 @@ class TestDataManager(unittest.TestCase):
     def test_update_user_score_with_corrupt_file(self):
         """Test updating a user score when there's a corrupt JSON file."""
         # Save an instance
-        filename = self.data_manager.save_instance("Q1", "A1", score=0.5)
-        
-        # Load the instance to get its datetime
-        instances = self.data_manager.load_instances()
-        datetime_str = instances[0]["datetime"]
+        datetime_str = self.data_manager.save_instance("Q1", "A1", score=0.5)
+        filename = self.data_manager.log_path
         
         # Make the file read-only to cause a write error
         os.chmod(filename, 0o444)
@@ -227,17 +247,18 @@ class TestDataManager(unittest.TestCase):
     def test_load_instances_file_open_error(self):
         """Test loading instances when file open fails."""
         # Create a file
-        filename = os.path.join(self.test_dir, "test.json")
+        filename = os.path.join(self.data_manager.data_dir, "test.json")
         with open(filename, "w") as f:
             f.write('{"input": "test", "prediction": "test", "datetime": "2021-01-01"}')
             
-        # Mock open to raise an exception
+        # Mock open to raise an exception for reads of that file
         original_open = open
+        targets = {filename}
         
-        def mock_open(*args, **kwargs):
-            if args[0] == os.path.join(self.test_dir, "test.json") and args[1] == "r":
+        def mock_open(path, mode="r", *args, **kwargs):
+            if path in targets and "r" in mode:
                 raise PermissionError("Permission denied")
-            return original_open(*args, **kwargs)
+            return original_open(path, mode, *args, **kwargs)
         
         # Create a data manager
         data_manager = MetricDataManager(
@@ -328,5 +349,434 @@ class TestDataManager(unittest.TestCase):
         self.assertEqual(len(instances), 1)
         self.assertEqual(instances[0]["input"], "test2")
 
+    def test_update_user_score_appends_record(self):
+        """Test that updates are appended to the log and supersede earlier records."""
+        self.data_manager.save_instance("Q1", "A1", score=0.5)
+        self.data_manager.save_instance("Q2", "A2", score=0.6)
+        instances = self.data_manager.load_instances()
+        
+        self.assertTrue(self.data_manager.update_user_score(instances[0]["datetime"], 0.8))
+        self.assertTrue(self.data_manager.update_user_score(instances[0]["datetime"], 0.9))
+        
+        # Each save and update is one line in the log; updates only hold the change
+        with open(self.data_manager.log_path, "r") as f:
+            lines = f.readlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(json.loads(lines[-1]), {"datetime": instances[0]["datetime"], "user_score": 0.9})
+        
+        # Only the latest record for each instance is returned
+        instances = self.data_manager.load_instances()
+        self.assertEqual(len(instances), 2)
+        self.assertEqual(instances[0]["user_score"], 0.9)
+        self.assertIsNone(instances[1]["user_score"])
+    
+    def test_save_instance_unique_datetimes(self):
+        """Test that saves within the same microsecond get distinct keys."""
+        fixed = datetime(2024, 1, 1, 12, 0, 0)
+        with patch('metric_learner.data_manager.datetime') as mock_datetime:
+            mock_datetime.now.return_value = fixed
+            for i in range(3):
+                self.data_manager.save_instance(f"Q{i}", f"A{i}", score=0.5)
+        
+        instances = self.data_manager.load_instances()
+        self.assertEqual([i["input"] for i in instances], ["Q0", "Q1", "Q2"])
+        self.assertEqual(
+            [i["datetime"] for i in instances],
+            ["2024-01-01T12:00:00.000000", "2024-01-01T12:00:00.000001", "2024-01-01T12:00:00.000002"]
+        )
+    
+    def test_save_instance_unique_across_managers(self):
+        """Test that managers sharing a directory never reuse a datetime."""
+        other = MetricDataManager(metric_name="test_metric", data_dir=self.test_dir)
+        fixed = datetime(2024, 1, 1, 12, 0, 0)
+        with patch('metric_learner.data_manager.datetime') as mock_datetime:
+            mock_datetime.now.return_value = fixed
+            keys = [
+                self.data_manager.save_instance("Q0", "A0", score=0.5),
+                other.save_instance("Q1", "A1", score=0.5),
+                self.data_manager.save_instance("Q2", "A2", score=0.5),
+                other.save_instance("Q3", "A3", score=0.5)
+            ]
+        
+        self.assertEqual(len(set(keys)), 4)
+        instances = MetricDataManager(metric_name="test_metric", data_dir=self.test_dir).load_instances()
+        self.assertEqual([i["input"] for i in instances], ["Q0", "Q1", "Q2", "Q3"])
+        self.assertEqual([i["datetime"] for i in instances], keys)
+    
+    def test_has_labeled(self):
+        """Test the check for labeled instances."""
+        self.assertFalse(self.data_manager.has_labeled())
+        self.data_manager.save_instance("Q1", "A1", score=0.5)
+        self.assertFalse(self.data_manager.has_labeled())
+        
+        datetime_str = self.data_manager.load_instances()[0]["datetime"]
+        self.data_manager.update_user_score(datetime_str, 0.9)
+        self.assertTrue(self.data_manager.has_labeled())
+    
+    def test_orphaned_score_update_ignored(self):
+        """Test that a score update for an unknown instance is skipped."""
+        self.data_manager.save_instance("Q1", "A1", score=0.5)
+        with open(self.data_manager.log_path, "a") as f:
+            f.write(json.dumps({"datetime": "2021-01-01T00:00:00", "user_score": 0.3}) + "\n")
+        
+        instances = self.data_manager.load_instances()
+        self.assertEqual([i["input"] for i in instances], ["Q1"])
+        self.assertEqual(self.data_manager.get_labeled_dataset(), [])
+    
+    def test_load_instances_with_corrupt_log_line(self):
+        """Test that a corrupt line in the log is skipped."""
+        self.data_manager.save_instance("Q1", "A1", score=0.5)
+        with open(self.data_manager.log_path, "a") as f:
+            f.write("{truncated\n")
+        self.data_manager.save_instance("Q2", "A2", score=0.6)
+        
+        instances = self.data_manager.load_instances()
+        
+        self.assertEqual([i["input"] for i in instances], ["Q1", "Q2"])
+    
+    def test_legacy_instance_files(self):
+        """Test that instances stored as individual JSON files are still supported."""
+        legacy_file = os.path.join(self.data_manager.data_dir, "2021-01-01T00-00-00.json")
+        with open(legacy_file, "w") as f:
+            json.dump({"input": "Q0", "prediction": "A0", "gold": None, "score": 0.4,
+                       "user_score": None, "datetime": "2021-01-01T00:00:00"}, f)
+        self.data_manager.save_instance("Q1", "A1", score=0.5)
+        
+        instances = self.data_manager.load_instances()
+        self.assertEqual([i["input"] for i in instances], ["Q0", "Q1"])
+        
+        # Legacy instances are updated in place
+        self.assertTrue(self.data_manager.update_user_score("2021-01-01T00:00:00", 0.7))
+        with open(legacy_file, "r") as f:
+            self.assertEqual(json.load(f)["user_score"], 0.7)
+    
+    def test_update_user_score_in_place(self):
+        """Test updating loaded instances without reading them back."""
+        legacy_file = os.path.join(self.data_manager.data_dir, "2021-01-01T00-00-00.json")
+        with open(legacy_file, "w") as f:
+            json.dump({"input": "Q0", "prediction": "A0", "gold": None, "score": 0.4,
+                       "user_score": None, "datetime": "2021-01-01T00:00:00"}, f)
+        self.data_manager.save_instance("Q1", "A1", score=0.5)
+        legacy, logged = self.data_manager.load_instances()
+
+        with patch("builtins.open", wraps=open) as mock_open:
+            self.assertTrue(self.data_manager.update_user_score_in_place(legacy, 0.7))
+            self.assertEqual([c.args[1] for c in mock_open.call_args_list], ["wb"])
+        self.assertTrue(self.data_manager.update_user_score_in_place(logged, 0.8))
+
+        self.assertEqual(legacy["user_score"], 0.7)
+        self.assertEqual([i["user_score"] for i in self.data_manager.load_instances()], [0.7, 0.8])
+        self.assertEqual(self.data_manager.count_unlabeled(), 0)
+
+        self.assertFalse(self.data_manager.update_user_score_in_place({"datetime": "nonexistent"}, 0.5))
+
+    def test_update_user_score_reuses_log_index(self):
+        """Test that updates do not reread an unchanged log."""
+        for i in range(3):
+            self.data_manager.save_instance(f"Q{i}", f"A{i}", score=0.5)
+        instances = self.data_manager.load_instances()
+        
+        with patch.object(self.data_manager, '_load_log', wraps=self.data_manager._load_log) as mock_load:
+            for instance in instances:
+                self.assertTrue(self.data_manager.update_user_score(instance["datetime"], 0.9))
+            mock_load.assert_not_called()
+        
+        self.assertEqual([i["user_score"] for i in self.data_manager.load_instances()], [0.9, 0.9, 0.9])
+    
+    def test_log_index_sees_external_writes(self):
+        """Test that records appended by another manager are picked up."""
+        self.data_manager.save_instance("Q1", "A1", score=0.5)
+        self.data_manager.load_instances()
+        
+        other = MetricDataManager(metric_name="test_metric", data_dir=self.test_dir)
+        other.save_instance("Q2", "A2", score=0.6)
+        datetime_str = other.load_instances()[-1]["datetime"]
+        
+        self.assertTrue(self.data_manager.update_user_score(datetime_str, 0.8))
+        self.assertEqual([i["input"] for i in self.data_manager.load_instances()], ["Q1", "Q2"])
+    
+    def test_load_instances_cached_until_write(self):
+        """Test that unchanged data is not reread from disk."""
+        self.data_manager.save_instance("Q1", "A1", score=0.5)
+        first = self.data_manager.load_instances()
+        
+        with patch.object(self.data_manager, '_legacy_files', wraps=self.data_manager._legacy_files) as mock_scan:
+            second = self.data_manager.load_instances()
+            mock_scan.assert_not_called()
+            
+            # Saving and labeling invalidate the cache
+            self.data_manager.save_instance("Q2", "A2", score=0.6)
+            self.assertEqual(len(self.data_manager.load_instances()), 2)
+            self.data_manager.update_user_score(first[0]["datetime"], 0.9)
+            self.assertEqual(len(self.data_manager.get_labeled_dataset()), 1)
+            self.assertEqual(mock_scan.call_count, 2)
+        
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+    
+    def test_load_instances_sees_new_legacy_files(self):
+        """Test that files added to the directory invalidate the cache."""
+        self.data_manager.save_instance("Q1", "A1", score=0.5)
+        self.data_manager.load_instances()
+        
+        with open(os.path.join(self.data_manager.data_dir, "2021-01-01T00-00-00.json"), "w") as f:
+            json.dump({"input": "Q0", "prediction": "A0", "gold": None, "score": 0.4,
+                       "user_score": 0.3, "datetime": "2021-01-01T00:00:00"}, f)
+        
+        self.assertEqual([i["input"] for i in self.data_manager.load_instances()], ["Q0", "Q1"])
+        self.assertEqual(len(self.data_manager.get_labeled_dataset()), 1)
+    
+    def test_unchanged_legacy_files_not_reparsed(self):
+        """Test that only new or rewritten legacy files are parsed again."""
+        for i in range(3):
+            with open(os.path.join(self.data_manager.data_dir, f"2021-01-01T00-00-0{i}.json"), "w") as f:
+                json.dump({"input": f"Q{i}", "prediction": "A", "gold": None, "score": 0.4,
+                           "user_score": None, "datetime": f"2021-01-01T00:00:0{i}"}, f)
+        self.data_manager.load_instances()
+
+        with patch("metric_learner.data_manager._loads", wraps=json.loads) as mock_loads:
+            self.data_manager.update_user_score("2021-01-01T00:00:01", 0.7)
+            mock_loads.reset_mock()
+            instances = self.data_manager.load_instances()
+            self.assertEqual(mock_loads.call_count, 1)
+
+        self.assertEqual([i["user_score"] for i in instances], [None, 0.7, None])
+
+        # Deleted files are dropped
+        os.remove(os.path.join(self.data_manager.data_dir, "2021-01-01T00-00-00.json"))
+        self.assertEqual([i["input"] for i in self.data_manager.load_instances()], ["Q1", "Q2"])
+
+    def test_legacy_file_without_datetime(self):
+        """Test that instances without a datetime sort first."""
+        self.data_manager.save_instance("Q1", "A1", score=0.5)
+        with open(os.path.join(self.data_manager.data_dir, "manual.json"), "w") as f:
+            json.dump({"input": "Q0", "prediction": "A0", "user_score": 0.3}, f)
+
+        instances = self.data_manager.load_instances()
+        self.assertEqual([i["input"] for i in instances], ["Q0", "Q1"])
+
+    def test_legacy_files_read_in_parallel(self):
+        """Test that many legacy files are read by a thread pool."""
+        for i in range(3):
+            with open(os.path.join(self.data_manager.data_dir, f"2021-01-01T00-00-0{i}.json"), "w") as f:
+                json.dump({"input": f"Q{i}", "prediction": "A", "gold": None, "score": 0.4,
+                           "user_score": None, "datetime": f"2021-01-01T00:00:0{i}"}, f)
+        with open(os.path.join(self.data_manager.data_dir, "corrupt.json"), "w") as f:
+            f.write("This is not valid JSON")
+
+        with patch("metric_learner.data_manager.PARALLEL_READ_MIN", 2), \
+             patch("metric_learner.data_manager.ThreadPoolExecutor",
+                   wraps=ThreadPoolExecutor) as mock_executor:
+            instances = self.data_manager.load_instances()
+            mock_executor.assert_called_once()
+
+        self.assertEqual([i["input"] for i in instances], ["Q0", "Q1", "Q2"])
+
+    def test_legacy_update_opens_file_directly(self):
+        """Test that legacy files are found from the datetime without a scan."""
+        legacy_file = os.path.join(self.data_manager.data_dir, "2021-01-01T00-00-00-000001.json")
+        with open(legacy_file, "w") as f:
+            json.dump({"input": "Q0", "prediction": "A0", "gold": None, "score": 0.4,
+                       "user_score": None, "datetime": "2021-01-01T00:00:00.000001"}, f)
+        
+        with patch.object(self.data_manager, '_legacy_files') as mock_scan:
+            self.assertTrue(self.data_manager.update_user_score("2021-01-01T00:00:00.000001", 0.7))
+            mock_scan.assert_not_called()
+        with open(legacy_file, "r") as f:
+            self.assertEqual(json.load(f)["user_score"], 0.7)
+    
+    def test_legacy_index_for_renamed_files(self):
+        """Test that renamed legacy files are found through a datetime index."""
+        for i in range(3):
+            with open(os.path.join(self.data_manager.data_dir, f"renamed-{i}.json"), "w") as f:
+                json.dump({"input": f"Q{i}", "prediction": f"A{i}", "gold": None, "score": 0.4,
+                           "user_score": None, "datetime": f"2021-01-0{i + 1}T00:00:00"}, f)
+        
+        with patch.object(self.data_manager, '_legacy_files', wraps=self.data_manager._legacy_files) as mock_scan:
+            for i in range(3):
+                self.assertTrue(self.data_manager.update_user_score(f"2021-01-0{i + 1}T00:00:00", 0.7))
+            self.assertFalse(self.data_manager.update_user_score("2021-01-09T00:00:00", 0.7))
+            
+            # One scan builds the index; only the unknown datetime rescans
+            self.assertEqual(mock_scan.call_count, 2)
+        
+        self.assertEqual([i["user_score"] for i in self.data_manager.load_instances()], [0.7, 0.7, 0.7])
+    
+    def test_load_instance_headers(self):
+        """Test listing instance datetimes without parsing legacy files."""
+        self.data_manager.save_instance("Q1", "A1", score=0.5)
+        for name, datetime_str in [("2021-01-01T00-00-00.json", "2021-01-01T00:00:00"),
+                                   ("2021-01-02T10-20-30-000001.json", "2021-01-02T10:20:30.000001")]:
+            with open(os.path.join(self.data_manager.data_dir, name), "w") as f:
+                json.dump({"input": "Q0", "prediction": "A0", "datetime": datetime_str}, f)
+        
+        with patch.object(self.data_manager, '_load_legacy') as mock_load:
+            headers = self.data_manager.load_instance_headers()
+            mock_load.assert_not_called()
+        
+        expected = [i["datetime"] for i in self.data_manager.load_instances()]
+        self.assertEqual([h["datetime"] for h in headers], expected)
+        self.assertEqual(expected[:2], ["2021-01-01T00:00:00", "2021-01-02T10:20:30.000001"])
+        
+        # Renamed files are opened to find their datetime
+        with open(os.path.join(self.data_manager.data_dir, "renamed.json"), "w") as f:
+            json.dump({"input": "Q2", "prediction": "A2", "datetime": "2020-06-01T00:00:00"}, f)
+        self.assertEqual(self.data_manager.load_instance_headers()[0], {"datetime": "2020-06-01T00:00:00"})
+    
+    def test_legacy_scan_skips_directories(self):
+        """Test that directories ending in .json are not read as instances."""
+        os.makedirs(os.path.join(self.data_manager.data_dir, "backup.json"))
+        self.data_manager.save_instance("Q1", "A1", score=0.5)
+        
+        instances = self.data_manager.load_instances()
+        self.assertEqual([i["input"] for i in instances], ["Q1"])
+        self.assertFalse(self.data_manager.update_user_score("missing", 0.7))
+
+    def test_stdlib_json_fallback(self):
+        """Test that the log is readable and writable without orjson."""
+        self.data_manager.save_instance("Q1", "A1", gold="A1", score=0.5)
+        with patch('metric_learner.data_manager.orjson', None):
+            self.data_manager.save_instance("Q2", "A2", score=0.6)
+            instances = self.data_manager.load_instances()
+        
+        self.assertEqual([i["input"] for i in instances], ["Q1", "Q2"])
+        self.assertEqual(instances[0]["gold"], "A1")
+    
+    def test_legacy_files_without_orjson(self):
+        """Test that legacy files are read and updated without orjson."""
+        legacy_file = os.path.join(self.data_manager.data_dir, "2021-01-01T00-00-00.json")
+        with open(legacy_file, "w") as f:
+            json.dump({"input": "Q0", "prediction": "A0", "gold": None, "score": 0.4,
+                       "user_score": None, "datetime": "2021-01-01T00:00:00"}, f)
+        
+        with patch('metric_learner.data_manager.orjson', None):
+            self.assertEqual([i["input"] for i in self.data_manager.load_instances()], ["Q0"])
+            self.assertTrue(self.data_manager.update_user_score("2021-01-01T00:00:00", 0.7))
+        
+        with open(legacy_file, "r") as f:
+            self.assertEqual(json.load(f)["user_score"], 0.7)
+    
+    def test_next_unlabeled(self):
+        """Test iterating over unlabeled instances in datetime order."""
+        self.assertIsNone(self.data_manager.next_unlabeled())
+        self.assertEqual(self.data_manager.count_unlabeled(), 0)
+        
+        self.data_manager.save_instance("Q1", "A1", score=0.5)
+        self.data_manager.save_instance("Q2", "A2", score=0.6)
+        self.assertEqual(self.data_manager.count_unlabeled(), 2)
+        
+        # Label the newest instance first, then the oldest
+        first = self.data_manager.next_unlabeled()
+        self.assertEqual(first["input"], "Q1")
+        second = self.data_manager.load_instances()[1]
+        self.data_manager.update_user_score(second["datetime"], 0.9)
+        self.assertEqual(self.data_manager.next_unlabeled()["input"], "Q1")
+        
+        self.data_manager.update_user_score(first["datetime"], 0.8)
+        self.assertIsNone(self.data_manager.next_unlabeled())
+        self.assertEqual(self.data_manager.count_unlabeled(), 0)
+        
+        # Newly saved instances are queued
+        self.data_manager.save_instance("Q3", "A3", score=0.7)
+        self.assertEqual(self.data_manager.next_unlabeled()["input"], "Q3")
+
+    def test_loaded_instances_are_copies(self):
+        """Test that editing a returned instance does not change the cache."""
+        self.data_manager.save_instance("Q1", "A1", score=0.5)
+        
+        self.data_manager.load_instances()[0]["input"] = "MUTATED"
+        self.data_manager.next_unlabeled()["input"] = "MUTATED"
+        for instance in self.data_manager.iter_unlabeled():
+            instance["input"] = "MUTATED"
+        
+        self.assertEqual(self.data_manager.load_instances()[0]["input"], "Q1")
+        self.assertEqual(self.data_manager.next_unlabeled()["input"], "Q1")
+    
+    def test_unlabeled_sees_other_writers(self):
+        """Test that instances saved by another manager are queued in order."""
+        self.data_manager.save_instance("Q1", "A1", score=0.5)
+        self.assertEqual(self.data_manager.count_unlabeled(), 1)
+        
+        other = MetricDataManager(metric_name="test_metric", data_dir=self.test_dir)
+        other.save_instance("Q2", "A2", score=0.6)
+        other.update_user_score(self.data_manager.next_unlabeled()["datetime"], 0.9)
+        
+        self.assertEqual(self.data_manager.count_unlabeled(), 1)
+        self.assertEqual(self.data_manager.next_unlabeled()["input"], "Q2")
+        self.assertEqual([i["input"] for i in self.data_manager.iter_unlabeled()], ["Q2"])
+
+    def test_compact_log(self):
+        """Test folding score updates into their instances."""
+        self.assertFalse(self.data_manager.compact_log())
+        
+        self.data_manager.save_instance("Q1", "A1", score=0.5)
+        self.data_manager.save_instance("Q2", "A2", score=0.6)
+        for instance in self.data_manager.load_instances():
+            self.data_manager.update_user_score(instance["datetime"], 0.9)
+        before = self.data_manager.load_instances()
+        
+        self.assertTrue(self.data_manager.compact_log())
+        with open(self.data_manager.log_path) as f:
+            self.assertEqual(len(f.readlines()), 2)
+        self.assertEqual(self.data_manager.load_instances(), before)
+        reloaded = MetricDataManager(metric_name="test_metric", data_dir=self.test_dir)
+        self.assertEqual(reloaded.load_instances(), before)
+    
+    def test_compact_log_writes_only_saved_data(self):
+        """Test that unsaved in-memory changes are not written by compaction."""
+        self.data_manager.save_instance("Q1", "A1", score=0.5)
+        instance = self.data_manager.load_instances()[0]
+        instance["input"] = "MUTATED"
+        self.assertTrue(self.data_manager.update_user_score(instance["datetime"], 0.9))
+        
+        # Even a diverged in-memory index is not written back
+        self.data_manager._read_log()[instance["datetime"]]["prediction"] = "MUTATED"
+        
+        self.assertTrue(self.data_manager.compact_log())
+        reloaded = MetricDataManager(metric_name="test_metric", data_dir=self.test_dir)
+        [saved] = reloaded.load_instances()
+        self.assertEqual((saved["input"], saved["prediction"], saved["user_score"]), ("Q1", "A1", 0.9))
+    
+    @unittest.skipIf(data_manager_module.fcntl is None, "file locking needs fcntl")
+    def test_compact_log_keeps_concurrent_appends(self):
+        """Test that a save during compaction waits for it instead of being lost."""
+        self.data_manager.save_instance("Q1", "A1", score=0.5)
+        other = MetricDataManager(metric_name="test_metric", data_dir=self.test_dir)
+        
+        load_log = self.data_manager._load_log
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            saves = []
+            
+            def load_log_during_save():
+                # Start another writer once compaction has read the log
+                saves.append(executor.submit(other.save_instance, "Q2", "A2", score=0.6))
+                self.assertRaises(TimeoutError, saves[0].result, timeout=0.1)
+                return load_log()
+            
+            with patch.object(self.data_manager, "_load_log", load_log_during_save):
+                self.assertTrue(self.data_manager.compact_log())
+            saves[0].result()
+        
+        reloaded = MetricDataManager(metric_name="test_metric", data_dir=self.test_dir)
+        self.assertEqual([i["input"] for i in reloaded.load_instances()], ["Q1", "Q2"])
+    
+    def test_iter_unlabeled(self):
+        """Test streaming unlabeled instances while labeling them."""
+        self.assertEqual(list(self.data_manager.iter_unlabeled()), [])
+        self.assertEqual(self.data_manager.count_instances(), 0)
+
+        self.data_manager.save_instance("Q1", "A1", score=0.5)
+        self.data_manager.save_instance("Q2", "A2", score=0.6)
+
+        # Saving scores during iteration does not disturb it
+        seen = []
+        for instance in self.data_manager.iter_unlabeled():
+            seen.append(instance["input"])
+            self.data_manager.update_user_score(instance["datetime"], 0.9)
+
+        self.assertEqual(seen, ["Q1", "Q2"])
+        self.assertEqual(list(self.data_manager.iter_unlabeled()), [])
+        self.assertEqual(self.data_manager.count_instances(), 2)
+
 if __name__ == '__main__':
     unittest.main()
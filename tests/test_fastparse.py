@@ -0,0 +1,48 @@
+import unittest
+
+from metric_learner._fastparse import has_complete_score, parse_score
+
+class TestParseScore(unittest.TestCase):
+    def test_bare_number(self):
+        """Test parsing a response that is just a number."""
+        self.assertEqual(parse_score("0.85"), 0.85)
+        self.assertEqual(parse_score(" 0.7\n"), 0.7)
+        self.assertEqual(parse_score("1"), 1.0)
+    
+    def test_number_in_text(self):
+        """Test falling back to the first number in free-form text."""
+        self.assertEqual(parse_score("The score is 0.75 out of 1."), 0.75)
+        self.assertEqual(parse_score("Rating: 0"), 0.0)
+    
+    def test_clamping(self):
+        """Test that scores are clamped to [0, 1]."""
+        self.assertEqual(parse_score("1.5"), 1.0)
+        self.assertEqual(parse_score("-0.5"), 0.0)
+        self.assertEqual(parse_score("Score: 7"), 1.0)
+    
+    def test_no_number(self):
+        """Test the default for responses without a number."""
+        self.assertEqual(parse_score("Not a number"), 0.5)
+        self.assertEqual(parse_score(""), 0.5)
+        self.assertEqual(parse_score("nan"), 0.5)
+        self.assertEqual(parse_score("inf"), 0.5)
+        self.assertEqual(parse_score("no idea", default=0.0), 0.0)
+
+class TestHasCompleteScore(unittest.TestCase):
+    def test_incomplete(self):
+        """Test partial responses whose first number may still grow."""
+        self.assertFalse(has_complete_score(""))
+        self.assertFalse(has_complete_score("Let me think"))
+        self.assertFalse(has_complete_score("0"))
+        self.assertFalse(has_complete_score("0."))
+        self.assertFalse(has_complete_score("Score: 0.8"))
+    
+    def test_complete(self):
+        """Test partial responses whose first number is final."""
+        self.assertTrue(has_complete_score("0.85\n"))
+        self.assertTrue(has_complete_score("Score: 0.8 because"))
+        self.assertTrue(has_complete_score("1. The answer"))
+        self.assertTrue(has_complete_score("0.9."))
+
+if __name__ == '__main__':
+    unittest.main()
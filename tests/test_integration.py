@@ -1,12 +1,10 @@
 import sys
 import os
+import subprocess
 import unittest
 from unittest.mock import MagicMock, patch
 import importlib.util
 
-# Add the parent directory to the path to import the package
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-
 import dspy
 import pytest
 from metric_learner import MetricLearner, MetricModule
@@ -95,6 +93,21 @@ class TestIntegration(unittest.TestCase):
         self.assertEqual(kwargs["model"], "gpt-3.5-turbo")
         self.assertEqual(kwargs["api_key"], "fake-key")
     
+    def test_data_manager_import_is_lazy(self):
+        """Test that importing MetricDataManager does not import dspy or numpy."""
+        code = (
+            "import sys\n"
+            "from metric_learner import MetricDataManager, label_instances\n"
+            "assert 'numpy' not in sys.modules\n"
+            "from metric_learner import LLMCache\n"
+            "assert 'dspy' not in sys.modules\n"
+            "from metric_learner import MetricModule\n"
+            "assert 'dspy' in sys.modules\n"
+        )
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+    
     @pytest.mark.integration
     def test_simple_workflow(self):
         """Test a simple workflow with the MetricLearner."""
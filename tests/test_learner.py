@@ -1,15 +1,15 @@
-import sys
-import os
+import io
 import unittest
 from unittest.mock import MagicMock, patch
 
-# Add the parent directory to the path to import the package
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-
 import dspy
 from metric_learner.learner import MetricLearner
 from metric_learner.metric_module import MetricModule
 
+# Examples shared by the tests; they are only read, never modified
+EXAMPLE_2PLUS2 = dspy.Example(question="What is 2+2?", answer="4")
+EXAMPLE_3PLUS3 = dspy.Example(question="What is 3+3?", answer="6")
+
 class TestMetricLearner(unittest.TestCase):
     def setUp(self):
         # Create a mock language model
@@ -55,7 +55,7 @@ class TestMetricLearner(unittest.TestCase):
         metric_fn = self.learner._create_metric_fn()
         
         # Create a mock example and prediction
-        example = dspy.Example(question="What is 2+2?", answer="4")
+        example = EXAMPLE_2PLUS2
         pred = MagicMock()
         pred.answer = "4"
         
@@ -69,34 +69,86 @@ class TestMetricLearner(unittest.TestCase):
         self.assertEqual(score, 0.75)
     
     def test_optimize(self):
-        """Test the optimize method."""
+        """Test the optimize method with different training sets and iteration counts."""
         # Create some examples
         examples = [
-            dspy.Example(question="What is 2+2?", answer="4"),
-            dspy.Example(question="What is 3+3?", answer="6")
+            EXAMPLE_2PLUS2,
+            EXAMPLE_3PLUS3
         ]
         
-        # Mock the optimizer class and instance
+        # Mock the optimizer class and instance, shared by all cases
         mock_optimizer = MagicMock()
         mock_optimized_program = MagicMock()
         mock_optimizer.compile.return_value = mock_optimized_program
+        optimizer_class = MagicMock(return_value=mock_optimizer)
+        self.learner.optimizer_class = optimizer_class
+        
+        for trainset, num_iterations in [(examples, 3), ([], 3), (examples, 10)]:
+            with self.subTest(num_examples=len(trainset), num_iterations=num_iterations):
+                optimizer_class.reset_mock()
+                mock_optimizer.compile.reset_mock()
+                self.learner.num_iterations = num_iterations
+                
+                # Call the optimize method
+                with patch('sys.stdout', new=io.StringIO()):
+                    result = self.learner.optimize(trainset)
+                
+                # Check that the optimizer was created with the right arguments
+                optimizer_class.assert_called_once()
+                args, kwargs = optimizer_class.call_args
+                self.assertEqual(kwargs["max_bootstrapped_demos"], num_iterations)
+                
+                # Check that the optimizer was called with the right arguments
+                mock_optimizer.compile.assert_called_once_with(self.mock_program, trainset=trainset)
+                
+                # Check that the optimized program was returned
+                self.assertEqual(result, mock_optimized_program)
+        
+    def test_optimize_num_threads(self):
+        """Test that optimizers accepting num_threads get a thread count."""
+        class ThreadedOptimizer:
+            def __init__(self, metric, max_bootstrapped_demos, num_threads=1):
+                self.num_threads = num_threads
+            def compile(self, student, trainset):
+                # Report the thread count instead of a compiled program
+                return self.num_threads
+        
+        class SerialOptimizer:
+            def __init__(self, metric, max_bootstrapped_demos):
+                pass
+            def compile(self, student, trainset):
+                return student
         
-        # Replace the optimizer_class with our mock
-        self.learner.optimizer_class = MagicMock(return_value=mock_optimizer)
-        
-        # Call the optimize method
-        result = self.learner.optimize(examples)
-        
-        # Check that the optimizer was created with the right arguments
-        self.learner.optimizer_class.assert_called_once()
-        args, kwargs = self.learner.optimizer_class.call_args
-        self.assertEqual(kwargs["max_bootstrapped_demos"], 3)
+        examples = [
+            EXAMPLE_2PLUS2,
+            EXAMPLE_3PLUS3
+        ]
         
-        # Check that the optimizer was called with the right arguments
-        mock_optimizer.compile.assert_called_once_with(self.mock_program, trainset=examples)
+        self.learner.verbose = False
+        self.learner.optimizer_class = ThreadedOptimizer
+        self.assertEqual(self.learner.optimize(examples), 2)
+        self.assertEqual(self.learner.optimize([]), 1)
+        self.learner.num_threads = 8
+        self.assertEqual(self.learner.optimize(examples), 8)
+        
+        # Optimizers without a num_threads argument are constructed as before
+        self.learner.optimizer_class = SerialOptimizer
+        self.learner.num_threads = None
+        self.assertIs(self.learner.optimize(examples), self.mock_program)
+        self.learner.num_threads = 8
+        with self.assertRaises(TypeError):
+            self.learner.optimize(examples)
+        
+    def test_create_metric_fn_is_reused(self):
+        """Test that the metric function is built once and reads current settings."""
+        metric_fn = self.learner._create_metric_fn()
+        self.assertIs(self.learner._create_metric_fn(), metric_fn)
         
-        # Check that the optimized program was returned
-        self.assertEqual(result, mock_optimized_program)
+        # Settings changed afterwards still apply
+        self.learner.verbose = False
+        with patch('sys.stdout', new=io.StringIO()) as fake_out:
+            metric_fn(EXAMPLE_2PLUS2, "4")
+        self.assertEqual(fake_out.getvalue(), "")
         
     def test_create_metric_fn_with_string_pred(self):
         """Test the _create_metric_fn method with a string prediction."""
@@ -104,7 +156,7 @@ class TestMetricLearner(unittest.TestCase):
         metric_fn = self.learner._create_metric_fn()
         
         # Create a mock example
-        example = dspy.Example(question="What is 2+2?", answer="4")
+        example = EXAMPLE_2PLUS2
         
         # Call the metric function with a string prediction
         score = metric_fn(example, "4")
@@ -131,63 +183,6 @@ class TestMetricLearner(unittest.TestCase):
         # Check that the score is still returned
         self.assertEqual(score, 0.75)
         
-    def test_optimize_with_empty_examples(self):
-        """Test the optimize method with empty examples."""
-        # Create an empty list of examples
-        examples = []
-        
-        # Mock the optimizer class and instance
-        mock_optimizer = MagicMock()
-        mock_optimized_program = MagicMock()
-        mock_optimizer.compile.return_value = mock_optimized_program
-        
-        # Replace the optimizer_class with our mock
-        self.learner.optimizer_class = MagicMock(return_value=mock_optimizer)
-        
-        # Call the optimize method
-        result = self.learner.optimize(examples)
-        
-        # Check that the optimizer was created with the right arguments
-        self.learner.optimizer_class.assert_called_once()
-        
-        # Check that the optimizer was called with the right arguments
-        mock_optimizer.compile.assert_called_once_with(self.mock_program, trainset=examples)
-        
-        # Check that the optimized program was returned
-        self.assertEqual(result, mock_optimized_program)
-        
-    def test_optimize_with_custom_num_iterations(self):
-        """Test the optimize method with a custom number of iterations."""
-        # Create some examples
-        examples = [
-            dspy.Example(question="What is 2+2?", answer="4"),
-            dspy.Example(question="What is 3+3?", answer="6")
-        ]
-        
-        # Create a learner with a custom number of iterations
-        learner = MetricLearner(
-            program=self.mock_program,
-            metric_module=self.metric_module,
-            num_iterations=10,
-            verbose=False
-        )
-        
-        # Mock the optimizer class and instance
-        mock_optimizer = MagicMock()
-        mock_optimized_program = MagicMock()
-        mock_optimizer.compile.return_value = mock_optimized_program
-        
-        # Replace the optimizer_class with our mock
-        learner.optimizer_class = MagicMock(return_value=mock_optimizer)
-        
-        # Call the optimize method
-        result = learner.optimize(examples)
-        
-        # Check that the optimizer was created with the right arguments
-        learner.optimizer_class.assert_called_once()
-        args, kwargs = learner.optimizer_class.call_args
-        self.assertEqual(kwargs["max_bootstrapped_demos"], 10)
-        
     def test_verbose_output(self):
         """Test that verbose output works correctly."""
         # Create a learner with verbose=True
@@ -202,20 +197,21 @@ class TestMetricLearner(unittest.TestCase):
         metric_fn = learner._create_metric_fn()
         
         # Create a mock example and prediction
-        example = dspy.Example(question="What is 2+2?", answer="4")
+        example = EXAMPLE_2PLUS2
         pred = MagicMock()
         pred.answer = "4"
         
-        # Patch the print function to capture output
-        with patch('builtins.print') as mock_print:
+        # Capture stdout
+        with patch('sys.stdout', new=io.StringIO()) as fake_out:
             # Call the metric function
             score = metric_fn(example, pred)
+            output = fake_out.getvalue()
             
-            # Check that print was called with the expected arguments
-            mock_print.assert_any_call("Question: What is 2+2?")
-            mock_print.assert_any_call("Predicted: 4")
-            mock_print.assert_any_call("Gold: 4")
-            mock_print.assert_any_call("Score: 0.75")
+        # Check that the expected lines were printed
+        self.assertIn("Question: What is 2+2?\n", output)
+        self.assertIn("Predicted: 4\n", output)
+        self.assertIn("Gold: 4\n", output)
+        self.assertIn("Score: 0.75\n", output)
             
     def test_non_verbose_output(self):
         """Test that non-verbose output works correctly."""
@@ -231,17 +227,17 @@ class TestMetricLearner(unittest.TestCase):
         metric_fn = learner._create_metric_fn()
         
         # Create a mock example and prediction
-        example = dspy.Example(question="What is 2+2?", answer="4")
+        example = EXAMPLE_2PLUS2
         pred = MagicMock()
         pred.answer = "4"
         
-        # Patch the print function to capture output
-        with patch('builtins.print') as mock_print:
+        # Capture stdout
+        with patch('sys.stdout', new=io.StringIO()) as fake_out:
             # Call the metric function
             score = metric_fn(example, pred)
             
-            # Check that print was not called
-            mock_print.assert_not_called()
+        # Check that nothing was printed
+        self.assertEqual(fake_out.getvalue(), "")
 
 if __name__ == '__main__':
     unittest.main()
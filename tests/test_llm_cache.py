@@ -0,0 +1,314 @@
+import os
+import copy
+import pickle
+import unittest
+import tempfile
+import shutil
+from unittest.mock import MagicMock, patch
+
+import dspy
+
+from metric_learner.llm_cache import (
+    LLMCache,
+    MemoryBackend,
+    FileBackend,
+    SemanticCache,
+    is_deterministic,
+    is_known_deterministic,
+    lm_model_id
+)
+from metric_learner.metric_module import MetricModule
+
+class TestMemoryBackend(unittest.TestCase):
+    def test_get_set_delete(self):
+        """Test basic get/set/delete operations."""
+        backend = MemoryBackend()
+        self.assertIsNone(backend.get("key"))
+
+        backend.set("key", {"score": 0.5})
+        self.assertEqual(backend.get("key"), {"score": 0.5})
+
+        backend.delete("key")
+        self.assertIsNone(backend.get("key"))
+
+        # Deleting a missing key is a no-op
+        backend.delete("key")
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted."""
+        backend = MemoryBackend(maxsize=2)
+        backend.set("a", {"score": 0.1})
+        backend.set("b", {"score": 0.2})
+
+        # Touch 'a' so that 'b' becomes the least recently used entry
+        backend.get("a")
+        backend.set("c", {"score": 0.3})
+
+        self.assertEqual(len(backend), 2)
+        self.assertIsNone(backend.get("b"))
+        self.assertEqual(backend.get("a"), {"score": 0.1})
+        self.assertEqual(backend.get("c"), {"score": 0.3})
+
+    def test_pickle_roundtrip(self):
+        """Test that the backend can be pickled despite its lock."""
+        backend = MemoryBackend()
+        backend.set("key", {"score": 0.5})
+        restored = pickle.loads(pickle.dumps(backend))
+        self.assertEqual(restored.get("key"), {"score": 0.5})
+
+class TestFileBackend(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.backend = FileBackend(cache_dir=self.test_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_get_set_delete(self):
+        """Test basic get/set/delete operations."""
+        key = LLMCache.make_key("template", "Q1", "A1")
+        self.assertIsNone(self.backend.get(key))
+
+        self.backend.set(key, {"score": 0.75})
+        self.assertEqual(self.backend.get(key), {"score": 0.75})
+
+        # Entries are sharded by the first two characters of the key
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir, key[:2], f"{key}.json")))
+
+        self.backend.delete(key)
+        self.assertIsNone(self.backend.get(key))
+
+    def test_corrupt_entry(self):
+        """Test that an unreadable entry is treated as a miss."""
+        key = LLMCache.make_key("template", "Q1", "A1")
+        os.makedirs(os.path.join(self.test_dir, key[:2]))
+        with open(os.path.join(self.test_dir, key[:2], f"{key}.json"), "w") as f:
+            f.write("not json")
+
+        self.assertIsNone(self.backend.get(key))
+
+class TestLLMCache(unittest.TestCase):
+    def test_make_key_deterministic(self):
+        """Test that equal requests map to the same key."""
+        key1 = LLMCache.make_key("t", "Q1", "A1", gold="A1", model="m")
+        key2 = LLMCache.make_key("t", "Q1", "A1", gold="A1", model="m")
+        self.assertEqual(key1, key2)
+        self.assertEqual(len(key1), 64)
+
+    def test_make_key_distinguishes_fields(self):
+        """Test that any differing field changes the key."""
+        base = LLMCache.make_key("t", "Q1", "A1", gold="A1", model="m")
+        self.assertNotEqual(base, LLMCache.make_key("t2", "Q1", "A1", gold="A1", model="m"))
+        self.assertNotEqual(base, LLMCache.make_key("t", "Q2", "A1", gold="A1", model="m"))
+        self.assertNotEqual(base, LLMCache.make_key("t", "Q1", "A2", gold="A1", model="m"))
+        self.assertNotEqual(base, LLMCache.make_key("t", "Q1", "A1", gold=None, model="m"))
+        self.assertNotEqual(base, LLMCache.make_key("t", "Q1", "A1", gold="A1", model="m2"))
+        self.assertNotEqual(
+            base,
+            LLMCache.make_key("t", "Q1", "A1", gold="A1", model="m",
+                              demonstrations=[{"input": "Q", "prediction": "A", "score": 1.0}])
+        )
+
+    def test_default_backend(self):
+        """Test that the cache defaults to an in-memory backend."""
+        cache = LLMCache()
+        self.assertIsInstance(cache.backend, MemoryBackend)
+
+    def test_is_deterministic(self):
+        """Test the determinism check for different LM shapes."""
+        self.assertTrue(is_deterministic(lambda prompt: "0.5"))
+
+        lm = MagicMock()
+        lm.kwargs = {"temperature": 0.0}
+        self.assertTrue(is_deterministic(lm))
+        lm.kwargs = {"temperature": 0.7}
+        self.assertFalse(is_deterministic(lm))
+
+    def test_is_known_deterministic(self):
+        """Test that only named models at temperature 0 count as deterministic."""
+        self.assertFalse(is_known_deterministic(lambda prompt: "0.5"))
+        
+        lm = MagicMock()
+        lm.kwargs = {"temperature": 0.0}
+        self.assertFalse(is_known_deterministic(lm))
+        lm.model = "openai/gpt-4o-mini"
+        self.assertTrue(is_known_deterministic(lm))
+        lm.kwargs = {"temperature": None}
+        self.assertFalse(is_known_deterministic(lm))
+    
+    def test_default_dspy_lm_is_cached(self):
+        """Test that a dspy.LM at its default temperature counts as deterministic."""
+        lm = dspy.LM("openai/gpt-4o-mini")
+        self.assertIsNone(lm.kwargs["temperature"])
+        self.assertTrue(is_deterministic(lm))
+        self.assertTrue(is_known_deterministic(lm))
+        
+        # Scores are memoized without an explicit cache
+        metric_module = MetricModule(lm=lm)
+        with patch.object(MetricModule, "_query_lm", return_value="0.8") as query:
+            self.assertEqual(metric_module("What is 2+2?", "4"), 0.8)
+            self.assertEqual(metric_module("What is 2+2?", "4"), 0.8)
+        self.assertEqual(query.call_count, 1)
+        
+        # Sampling, or turning off dspy's own cache, disables the default
+        self.assertFalse(is_known_deterministic(dspy.LM("openai/gpt-4o-mini", temperature=0.7)))
+        self.assertFalse(is_known_deterministic(dspy.LM("openai/gpt-4o-mini", cache=False)))
+    
+    def test_lm_model_id(self):
+        """Test the model identifier lookup."""
+        lm = MagicMock()
+        lm.model = "openai/gpt-4o-mini"
+        self.assertEqual(lm_model_id(lm), "openai/gpt-4o-mini")
+        self.assertEqual(lm_model_id(MagicMock()), "MagicMock")
+
+def bag_of_words_embedder(text):
+    """Tiny deterministic embedder: counts of a fixed vocabulary."""
+    vocab = ["capital", "france", "paris", "rome", "2+2", "4", "5"]
+    lowered = text.lower()
+    return [lowered.count(word) for word in vocab]
+
+class TestSemanticCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = SemanticCache(bag_of_words_embedder, threshold=0.9)
+
+    def test_embed_normalizes(self):
+        """Test that embeddings have unit length."""
+        vector = self.cache.embed("capital of france? paris")
+        self.assertAlmostEqual(float((vector ** 2).sum()), 1.0, places=5)
+
+    def test_embeddings_are_memoized(self):
+        """Test that repeated prompts are embedded only once."""
+        embedder = MagicMock(side_effect=bag_of_words_embedder)
+        cache = SemanticCache(embedder)
+
+        first = cache.embed("Capital of France? Paris")
+        second = cache.embed("Capital of France? Paris")
+        cache.embed("What is 2+2? 4")
+
+        self.assertIs(first, second)
+        self.assertFalse(first.flags.writeable)
+        self.assertEqual(embedder.call_count, 2)
+
+    def test_similar_prompt_hits(self):
+        """Test that a near-duplicate prompt returns the cached value."""
+        self.assertIsNone(self.cache.query(self.cache.embed("Capital of France? Paris")))
+
+        self.cache.add(self.cache.embed("Capital of France? Paris"), {"score": 1.0})
+
+        self.assertEqual(self.cache.query(self.cache.embed("capital of FRANCE?? paris")), {"score": 1.0})
+        self.assertIsNone(self.cache.query(self.cache.embed("What is 2+2? 5")))
+
+    def test_ttl_expiry(self):
+        """Test that expired entries are no longer returned."""
+        self.cache.ttl = 10
+        with patch("metric_learner.llm_cache.time.monotonic", return_value=100.0):
+            self.cache.add(self.cache.embed("Capital of France? Paris"), {"score": 1.0})
+        with patch("metric_learner.llm_cache.time.monotonic", return_value=111.0):
+            self.assertIsNone(self.cache.query(self.cache.embed("Capital of France? Paris")))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_maxsize_eviction(self):
+        """Test that the oldest entry is evicted when the cache is full."""
+        self.cache.maxsize = 1
+        self.cache.add(self.cache.embed("Capital of France? Paris"), {"score": 1.0})
+        self.cache.add(self.cache.embed("What is 2+2? 4"), {"score": 0.9})
+
+        self.assertEqual(len(self.cache), 1)
+        self.assertIsNone(self.cache.query(self.cache.embed("Capital of France? Paris")))
+
+class TestMetricModuleCache(unittest.TestCase):
+    def setUp(self):
+        self.mock_lm = MagicMock()
+        self.mock_lm.return_value = "0.75"
+        self.metric_module = MetricModule(lm=self.mock_lm, cache=LLMCache())
+
+    def test_cache_hit_skips_lm(self):
+        """Test that a repeated request does not call the LM again."""
+        score1 = self.metric_module("What is 2+2?", "4", gold="4")
+        score2 = self.metric_module("What is 2+2?", "4", gold="4")
+
+        self.assertEqual(score1, 0.75)
+        self.assertEqual(score2, 0.75)
+        self.mock_lm.assert_called_once()
+
+    def test_cache_miss_on_different_request(self):
+        """Test that different requests are scored separately."""
+        self.metric_module("What is 2+2?", "4")
+        self.metric_module("What is 2+2?", "5")
+
+        self.assertEqual(self.mock_lm.call_count, 2)
+
+    def test_cache_invalidated_by_demonstrations(self):
+        """Test that adding demonstrations changes the cache key."""
+        self.metric_module("What is 2+2?", "4")
+        self.metric_module.add_demonstration("What is 1+1?", "2", score=1.0)
+        self.metric_module("What is 2+2?", "4")
+
+        self.assertEqual(self.mock_lm.call_count, 2)
+
+    def test_no_cache_for_nondeterministic_lm(self):
+        """Test that sampling LMs are never cached."""
+        self.mock_lm.kwargs = {"temperature": 1.0}
+        self.metric_module("What is 2+2?", "4")
+        self.metric_module("What is 2+2?", "4")
+
+        self.assertEqual(self.mock_lm.call_count, 2)
+
+    def test_lm_failure_not_cached(self):
+        """Test that default scores from LM failures are not cached."""
+        self.mock_lm.side_effect = [Exception("LM failure"), "0.9"]
+
+        self.assertEqual(self.metric_module("What is 2+2?", "4"), 0.5)
+        self.assertEqual(self.metric_module("What is 2+2?", "4"), 0.9)
+
+    def test_scores_memoized_by_default(self):
+        """Test that modules without an explicit cache reuse deterministic scores."""
+        self.mock_lm.model = "openai/gpt-4o-mini"
+        self.mock_lm.kwargs = {"temperature": 0.0}
+        metric_module = MetricModule(lm=self.mock_lm)
+        metric_module("What is 2+2?", "4", gold="4")
+        metric_module("What is 2+2?", "4", gold="4")
+        self.mock_lm.assert_called_once()
+        
+        # Copies made by optimizers share the cache
+        self.assertIs(metric_module.deepcopy().cache, metric_module.cache)
+        self.assertIs(copy.deepcopy(metric_module).cache, metric_module.cache)
+    
+    def test_default_cache_skips_unknown_lms(self):
+        """Test that LMs not known to be deterministic are not cached by default."""
+        scores = iter(["0.1", "0.2"])
+        metric_module = MetricModule(lm=lambda prompt: next(scores))
+        
+        self.assertEqual(metric_module("What is 2+2?", "4"), 0.1)
+        self.assertEqual(metric_module("What is 2+2?", "4"), 0.2)
+    
+    def test_lm_reassignment_changes_key(self):
+        """Test that a newly assigned LM never gets the previous LM's scores."""
+        metric_module = MetricModule(lm=lambda prompt: "0.9", cache=LLMCache())
+        self.assertEqual(metric_module("What is 2+2?", "4"), 0.9)
+        
+        metric_module.lm = lambda prompt: "0.1"
+        self.assertEqual(metric_module("What is 2+2?", "4"), 0.1)
+    
+    def test_cache_disabled(self):
+        """Test that cache=False always queries the LM."""
+        metric_module = MetricModule(lm=self.mock_lm, cache=False)
+        metric_module("What is 2+2?", "4")
+        metric_module("What is 2+2?", "4")
+        self.assertIsNone(metric_module.cache)
+        self.assertEqual(self.mock_lm.call_count, 2)
+    
+    def test_semantic_cache_hit_skips_lm(self):
+        """Test that a near-duplicate request is served from the semantic cache."""
+        metric_module = MetricModule(
+            lm=self.mock_lm,
+            semantic_cache=SemanticCache(bag_of_words_embedder, threshold=0.9)
+        )
+        metric_module("Capital of France?", "Paris")
+        score = metric_module("capital of france??", "Paris")
+
+        self.assertEqual(score, 0.75)
+        self.mock_lm.assert_called_once()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,11 @@
-import sys
 import os
+import asyncio
+import shutil
+import tempfile
 import unittest
 from unittest.mock import MagicMock, patch
 
-# Add the parent directory to the path to import the package
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-
+import dspy
 from metric_learner.metric_module import MetricModule
 
 class TestMetricModule(unittest.TestCase):
@@ -29,6 +29,17 @@ class TestMetricModule(unittest.TestCase):
         metric_module = MetricModule(lm=self.mock_lm, prompt_template=custom_template)
         self.assertEqual(metric_module.prompt_template, custom_template)
     
+    def test_prompt_template_unknown_field(self):
+        """Test that a misspelled template field is rejected at construction."""
+        with self.assertRaises(ValueError):
+            MetricModule(lm=self.mock_lm, prompt_template="Rate '{predicton}' for '{input}'.")
+    
+    def test_prompt_template_reassignment(self):
+        """Test that assigning a new template is reflected in the prompt."""
+        self.metric_module.prompt_template = "Q={input!r} A={prediction:>3} {{literal}}"
+        prompt = self.metric_module._build_suffix("x", "y")
+        self.assertEqual(prompt, "Q='x' A=  y {literal}")
+    
     def test_forward_basic(self):
         """Test the forward method with basic input."""
         # Call the forward method
@@ -68,33 +79,18 @@ class TestMetricModule(unittest.TestCase):
         # Check that the score is correct
         self.assertEqual(score, 0.75)
     
-    def test_parse_score_valid(self):
-        """Test the _parse_score method with a valid score."""
-        # Test with a valid score
-        score = self.metric_module._parse_score("0.75")
-        self.assertEqual(score, 0.75)
-        
-        # Test with a valid score in a sentence
-        score = self.metric_module._parse_score("The score is 0.75 out of 1.")
-        self.assertEqual(score, 0.75)
-    
-    def test_parse_score_invalid(self):
-        """Test the _parse_score method with an invalid score."""
-        # Test with an invalid score
-        score = self.metric_module._parse_score("Not a number")
-        self.assertEqual(score, 0.5)  # Default score
-    
-    def test_parse_score_out_of_range_high(self):
-        """Test the _parse_score method with a score > 1."""
-        # Test with a score > 1
-        score = self.metric_module._parse_score("1.5")
-        self.assertEqual(score, 1.0)  # Capped at 1.0
-    
-    def test_parse_score_out_of_range_low(self):
-        """Test the _parse_score method with a score < 0."""
-        # Test with a score < 0
-        score = self.metric_module._parse_score("-0.5")
-        self.assertEqual(score, 0.0)  # Capped at 0.0
+    def test_parse_score(self):
+        """Test the _parse_score method on valid, invalid and out-of-range responses."""
+        cases = [
+            ("0.75", 0.75),
+            ("The score is 0.75 out of 1.", 0.75),
+            ("Not a number", 0.5),  # Default score
+            ("1.5", 1.0),  # Capped at 1.0
+            ("-0.5", 0.0),  # Capped at 0.0
+        ]
+        for response, expected in cases:
+            with self.subTest(response=response):
+                self.assertEqual(self.metric_module._parse_score(response), expected)
     
     def test_get_learned_metric_fn(self):
         """Test the get_learned_metric_fn method."""
@@ -115,8 +111,9 @@ class TestMetricModule(unittest.TestCase):
     
     def test_error_handling_lm_failure(self):
         """Test error handling when the LM fails."""
-        # Create a mock LM that raises an exception
-        error_lm = MagicMock(side_effect=Exception("LM failure"))
+        # Create an LM that raises an exception
+        def error_lm(prompt):
+            raise Exception("LM failure")
         
         # Create a metric module with the error LM
         error_metric_module = MetricModule(lm=error_lm)
@@ -126,7 +123,20 @@ class TestMetricModule(unittest.TestCase):
         
         # Check that a default score is returned
         self.assertEqual(score, 0.5)  # Default score
-    
+
+    def test_error_handling_raise(self):
+        """Test that on_error='raise' propagates LM failures."""
+        def error_lm(prompt):
+            raise RuntimeError("LM failure")
+        
+        error_metric_module = MetricModule(lm=error_lm, on_error="raise")
+
+        with self.assertRaises(RuntimeError):
+            error_metric_module("What is 2+2?", "4")
+
+        with self.assertRaises(ValueError):
+            MetricModule(lm=error_lm, on_error="ignore")
+
     def test_add_demonstration(self):
         """Test adding a demonstration to the metric module."""
         # Initial state
@@ -243,5 +253,192 @@ class TestMetricModule(unittest.TestCase):
             # Check that the default score is returned
             self.assertEqual(score, 0.5)
 
+    def test_prompt_prefix_is_stable(self):
+        """Test that dynamic fields only appear after the shared static prefix."""
+        self.metric_module.add_demonstration("What is 1+1?", "2", gold="2", score=1.0)
+        prefix = self.metric_module._build_prefix()
+        
+        prompt1 = self.metric_module._build_prompt("What is 2+2?", "4", gold="4")
+        prompt2 = self.metric_module._build_prompt("Capital of France?", "Paris")
+        
+        self.assertTrue(prompt1.startswith(prefix))
+        self.assertTrue(prompt2.startswith(prefix))
+        self.assertNotIn("What is 2+2?", prefix)
+        self.assertIn("Correct answer: 4", prompt1)
+
+    def test_prompt_prefix_is_cached(self):
+        """Test that the prefix is reused until the demonstrations change."""
+        prefix = self.metric_module._build_prefix()
+        self.assertIs(self.metric_module._build_prefix(), prefix)
+
+        self.metric_module.add_demonstration("What is 1+1?", "2", score=1.0)
+        with_demo = self.metric_module._build_prefix()
+        self.assertIn("What is 1+1?", with_demo)
+
+        self.metric_module.demonstrations = [
+            {"input": "What is 3+3?", "prediction": "6", "score": 1.0}
+        ]
+        self.assertIn("What is 3+3?", self.metric_module._build_prefix())
+        self.assertNotIn("What is 1+1?", self.metric_module._build_prefix())
+
+        # Demonstrations replaced or edited in place are picked up as well
+        self.metric_module.demonstrations[0] = {"input": "What is 4+4?", "prediction": "8", "score": 1.0}
+        self.assertIn("What is 4+4?", self.metric_module._build_prefix())
+        self.metric_module.demonstrations[0]["score"] = 0.0
+        self.assertIn("Rating: 0.0", self.metric_module._build_prefix())
+
+        self.metric_module.clear_demonstrations()
+        self.assertEqual(self.metric_module._build_prefix(), prefix)
+
+    def test_gold_placeholder_in_template(self):
+        """Test that a '{gold}' placeholder is filled instead of appending the gold answer."""
+        metric_module = MetricModule(
+            lm=self.mock_lm,
+            prompt_template="Rate the answer.\nQuestion: {input}\nAnswer: {prediction}\nGold: {gold}"
+        )
+        prompt = metric_module._build_prompt("What is 2+2?", "4", gold="4")
+        
+        self.assertIn("Gold: 4", prompt)
+        self.assertNotIn("Correct answer:", prompt)
+    
+    def test_dspy_lm_receives_messages(self):
+        """Test that DSPy LMs get the static prefix as a system message."""
+        dspy_lm = MagicMock(spec=dspy.LM)
+        dspy_lm.return_value = ["0.8"]
+        metric_module = MetricModule(lm=dspy_lm)
+        
+        score = metric_module("What is 2+2?", "4")
+        
+        self.assertEqual(score, 0.8)
+        messages = dspy_lm.call_args.kwargs["messages"]
+        self.assertEqual(messages[0], {"role": "system", "content": metric_module._build_prefix()})
+        self.assertEqual(messages[1]["role"], "user")
+        self.assertIn("What is 2+2?", messages[1]["content"])
+    
+    def test_abatch(self):
+        """Test scoring several examples concurrently."""
+        self.mock_lm.side_effect = lambda prompt: "0.9" if "Paris" in prompt else "0.1"
+        examples = [
+            {"input": "Capital of France?", "prediction": "Paris", "gold": "Paris"},
+            {"input": "Capital of France?", "prediction": "Rome"},
+            {"input": None, "prediction": "Paris"}
+        ]
+        
+        scores = asyncio.run(self.metric_module.abatch(examples, max_concurrency=2))
+        
+        # Scores are returned in input order, with the usual None handling
+        self.assertEqual(scores, [0.9, 0.1, 0.5])
+        self.assertEqual(self.mock_lm.call_count, 2)
+    
+    def test_abatch_empty(self):
+        """Test that an empty batch returns an empty list."""
+        scores = asyncio.run(self.metric_module.abatch([]))
+        self.assertEqual(scores, [])
+        self.mock_lm.assert_not_called()
+    
+    def test_streaming_lm_stops_early(self):
+        """Test that streaming stops once the score has arrived."""
+        class StreamingLM:
+            def __init__(self):
+                self.consumed = []
+                self.closed = False
+            
+            def stream(self, prompt):
+                try:
+                    for chunk in ["Score", ": 0", ".8", "5 ", "because", " the", " answer"]:
+                        self.consumed.append(chunk)
+                        yield chunk
+                finally:
+                    self.closed = True
+        
+        lm = StreamingLM()
+        metric_module = MetricModule(lm=lm)
+        
+        score = metric_module("What is 2+2?", "4")
+        
+        self.assertEqual(score, 0.85)
+        self.assertEqual(lm.consumed, ["Score", ": 0", ".8", "5 "])
+        self.assertTrue(lm.closed)
+    
+    def test_streaming_lm_bare_number(self):
+        """Test that a streamed bare number is read to the end."""
+        class StreamingLM:
+            def stream(self, prompt):
+                return iter(["0", ".", "7"])
+        
+        metric_module = MetricModule(lm=StreamingLM())
+        self.assertEqual(metric_module("What is 2+2?", "4"), 0.7)
+    
+    def test_trivial_shortcircuit(self):
+        """Test that exact matches of the gold answer skip the LM."""
+        metric_module = MetricModule(lm=self.mock_lm, trivial_shortcircuit=True)
+        
+        self.assertEqual(metric_module("Capital of France?", " paris\n", gold="Paris"), 1.0)
+        self.assertEqual(metric_module("Who wrote it?", "Jane  Austen", gold="jane austen"), 1.0)
+        self.mock_lm.assert_not_called()
+        
+        # Non-matching predictions and missing gold answers still go to the LM
+        self.assertEqual(metric_module("Capital of France?", "Rome", gold="Paris"), 0.75)
+        self.assertEqual(metric_module("Capital of France?", "Paris"), 0.75)
+        self.assertEqual(self.mock_lm.call_count, 2)
+    
+    def test_trivial_shortcircuit_disabled_by_default(self):
+        """Test that exact matches are scored by the LM unless enabled."""
+        self.assertEqual(self.metric_module("Capital of France?", "Paris", gold="Paris"), 0.75)
+        self.mock_lm.assert_called_once()
+    
+    def test_save_and_load_state(self):
+        """Test that the template and demonstrations survive save/load."""
+        self.metric_module.prompt_template = "Rate {prediction} for {input} against {gold}"
+        self.metric_module.add_demonstration("What is 1+1?", "2", gold="2", score=1.0)
+        
+        test_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(test_dir, "metric.json")
+            self.metric_module.save(path)
+            
+            loaded = MetricModule(lm=self.mock_lm)
+            loaded.load(path)
+        finally:
+            shutil.rmtree(test_dir)
+        
+        self.assertEqual(loaded.prompt_template, "Rate {prediction} for {input} against {gold}")
+        self.assertEqual(loaded.demonstrations, self.metric_module.demonstrations)
+        self.assertIn("Correct answer: 2", loaded._build_prompt("What is 2+2?", "4"))
+    
+    def test_call_does_not_inspect_stack(self):
+        """Test that calling the module skips dspy's stack inspection."""
+        with patch("inspect.stack") as mock_stack:
+            score = self.metric_module("What is 2+2?", "4")
+        
+        self.assertEqual(score, 0.75)
+        mock_stack.assert_not_called()
+        
+        # dspy's check on direct forward() calls is left in place
+        with patch("inspect.stack", return_value=[]) as mock_stack:
+            self.metric_module.forward("What is 2+2?", "4")
+        mock_stack.assert_called_once()
+    
+    def test_call_runs_dspy_callbacks(self):
+        """Test that calling the module still fires dspy callbacks."""
+        from dspy.utils.callback import BaseCallback
+        
+        events = []
+        
+        class RecordingCallback(BaseCallback):
+            def on_module_start(self, call_id, instance, inputs):
+                events.append(("start", instance))
+            
+            def on_module_end(self, call_id, outputs, exception=None):
+                events.append(("end", outputs, exception))
+        
+        with dspy.context(callbacks=[RecordingCallback()]):
+            score = self.metric_module("What is 2+2?", "4")
+        
+        self.assertEqual(score, 0.75)
+        self.assertEqual([event[0] for event in events], ["start", "end"])
+        self.assertIs(events[0][1], self.metric_module)
+        self.assertEqual(events[1][1:], (0.75, None))
+
 if __name__ == '__main__':
     unittest.main()
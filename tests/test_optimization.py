@@ -1,18 +1,23 @@
-import sys
+import io
 import os
+import asyncio
+import time
 import unittest
+import tempfile
+import shutil
 from unittest.mock import MagicMock, patch
 import numpy as np
 
-# Add the parent directory to the path to import the package
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-
 import dspy
 from metric_learner.optimization import (
     get_labeled_dataset,
     mse_metric,
     optimize_metric_module,
-    MetricEvaluator
+    load_or_optimize_metric_module,
+    hash_trainset,
+    MetricEvaluator,
+    _hash_optimization_config,
+    _pearson
 )
 from metric_learner.metric_module import MetricModule
 from metric_learner.data_manager import MetricDataManager
@@ -108,6 +113,156 @@ class TestOptimization(unittest.TestCase):
         # Check that the optimized module was returned
         self.assertEqual(result, mock_optimized)
     
+    def test_optimize_metric_module_num_threads_default(self):
+        """Test that optimizers accepting num_threads get a default thread count."""
+        class ThreadedOptimizer:
+            def __init__(self, metric, num_threads=1):
+                self.num_threads = num_threads
+            def compile(self, student, trainset):
+                # Report the thread count instead of a compiled program
+                return self.num_threads
+        
+        class SerialOptimizer:
+            def __init__(self, metric):
+                pass
+            def compile(self, student, trainset):
+                return student
+        
+        dataset = [
+            dspy.Example(input=f"Q{i}", prediction=f"A{i}", gold=f"A{i}", user_score=0.5).with_inputs("input", "prediction", "gold")
+            for i in range(3)
+        ]
+        
+        self.assertEqual(optimize_metric_module(self.metric_module, dataset, optimizer_class=ThreadedOptimizer), 3)
+        self.assertEqual(optimize_metric_module(self.metric_module, dataset, optimizer_class=ThreadedOptimizer, num_threads=8), 8)
+        
+        # Optimizers without a num_threads argument are constructed as before
+        self.assertIs(optimize_metric_module(self.metric_module, dataset, optimizer_class=SerialOptimizer), self.metric_module)
+        with self.assertRaises(TypeError):
+            optimize_metric_module(self.metric_module, dataset, optimizer_class=SerialOptimizer, num_threads=8)
+    
+    def test_optimize_metric_module_deduplicates(self):
+        """Test that duplicate examples are removed before optimization."""
+        trainsets = []
+        
+        class RecordingOptimizer:
+            def __init__(self, metric):
+                pass
+            def compile(self, student, trainset):
+                trainsets.append(trainset)
+                return student
+        
+        dataset = [
+            dspy.Example(input="Q1", prediction="A1", gold="A1", user_score=0.8).with_inputs("input", "prediction", "gold"),
+            dspy.Example(input="Q2", prediction="A2", gold=None, user_score=0.5).with_inputs("input", "prediction", "gold"),
+            dspy.Example(input="Q1", prediction="A1", gold="A1", user_score=0.8000001).with_inputs("input", "prediction", "gold"),
+            dspy.Example(input="Q1", prediction="A1", gold="A1", user_score=0.3).with_inputs("input", "prediction", "gold")
+        ]
+        
+        optimize_metric_module(self.metric_module, dataset, optimizer_class=RecordingOptimizer)
+        
+        self.assertEqual(trainsets[0], [dataset[0], dataset[1], dataset[3]])
+    
+    def test_hash_trainset(self):
+        """Test that the trainset hash ignores order but not content."""
+        dataset = [
+            dspy.Example(input=f"Q{i}", prediction=f"A{i}", gold=f"A{i}", user_score=0.5).with_inputs("input", "prediction", "gold")
+            for i in range(3)
+        ]
+        relabeled = dataset[:2] + [dataset[2].copy(user_score=0.9)]
+        
+        self.assertEqual(hash_trainset(dataset), hash_trainset(list(reversed(dataset))))
+        self.assertNotEqual(hash_trainset(dataset), hash_trainset(relabeled))
+    
+    def test_load_or_optimize_metric_module(self):
+        """Test that an optimized module is saved once and then reloaded."""
+        compile_calls = []
+        
+        class DemoOptimizer:
+            def __init__(self, metric):
+                pass
+            def compile(self, student, trainset):
+                compile_calls.append(len(trainset))
+                optimized = student.deepcopy()
+                optimized.add_demonstration("Q0", "A0", score=0.5)
+                return optimized
+        
+        dataset = [
+            dspy.Example(input=f"Q{i}", prediction=f"A{i}", gold=f"A{i}", user_score=0.5).with_inputs("input", "prediction", "gold")
+            for i in range(3)
+        ]
+        cache_dir = tempfile.mkdtemp()
+        try:
+            first = load_or_optimize_metric_module(
+                self.metric_module, dataset, cache_dir, name="accuracy", optimizer_class=DemoOptimizer
+            )
+            second = load_or_optimize_metric_module(
+                self.metric_module, dataset, cache_dir, name="accuracy", optimizer_class=DemoOptimizer
+            )
+            
+            self.assertEqual(compile_calls, [3])
+            config_hash = _hash_optimization_config(self.metric_module, {"optimizer_class": DemoOptimizer})
+            self.assertEqual(
+                os.listdir(cache_dir),
+                [f"accuracy_{hash_trainset(dataset)[:16]}_{config_hash[:16]}.json"]
+            )
+            self.assertEqual(second.demonstrations, first.demonstrations)
+            self.assertEqual(self.metric_module.demonstrations, [])
+            
+            # A different training set is optimized again
+            load_or_optimize_metric_module(
+                self.metric_module, dataset[:2], cache_dir, name="accuracy", optimizer_class=DemoOptimizer
+            )
+            self.assertEqual(compile_calls, [3, 2])
+        finally:
+            shutil.rmtree(cache_dir)
+    
+    def test_load_or_optimize_metric_module_config_changes(self):
+        """Test that a changed template, optimizer or metric is optimized again."""
+        compile_calls = []
+        
+        class DemoOptimizer:
+            def __init__(self, metric):
+                pass
+            def compile(self, student, trainset):
+                compile_calls.append(type(self).__name__)
+                return student.deepcopy()
+        
+        class OtherOptimizer(DemoOptimizer):
+            pass
+        
+        dataset = [
+            dspy.Example(input=f"Q{i}", prediction=f"A{i}", gold=f"A{i}", user_score=0.5).with_inputs("input", "prediction", "gold")
+            for i in range(3)
+        ]
+        cache_dir = tempfile.mkdtemp()
+        try:
+            def run(metric_module, **kwargs):
+                kwargs.setdefault("optimizer_class", DemoOptimizer)
+                load_or_optimize_metric_module(metric_module, dataset, cache_dir, **kwargs)
+            
+            run(self.metric_module)
+            run(self.metric_module)
+            self.assertEqual(compile_calls, ["DemoOptimizer"])
+            
+            run(self.metric_module, optimizer_class=OtherOptimizer)
+            self.assertEqual(compile_calls, ["DemoOptimizer", "OtherOptimizer"])
+            
+            run(self.metric_module, metric_fn=lambda example, pred, trace=None: 0.0)
+            self.assertEqual(len(compile_calls), 3)
+            
+            retemplated = self.metric_module.deepcopy()
+            retemplated.prompt_template = "Score {prediction} for {input}"
+            run(retemplated)
+            self.assertEqual(len(compile_calls), 4)
+            
+            # Each configuration still hits its own cached module
+            run(retemplated)
+            run(self.metric_module, optimizer_class=OtherOptimizer)
+            self.assertEqual(len(compile_calls), 4)
+        finally:
+            shutil.rmtree(cache_dir)
+    
     def test_metric_evaluator_no_data(self):
         """Test the MetricEvaluator with no data."""
         # Set up the mock data manager to return an empty dataset
@@ -149,6 +304,27 @@ class TestOptimization(unittest.TestCase):
         # Check the number of examples
         self.assertEqual(metrics["num_examples"], 2)
 
+    def test_metric_evaluator_async(self):
+        """Test that aevaluate matches evaluate."""
+        examples = [
+            dspy.Example(input="Q1", prediction="A1", gold="A1", user_score=0.8).with_inputs("input", "prediction", "gold"),
+            dspy.Example(input="Q2", prediction="A2", gold=None, user_score=0.2).with_inputs("input", "prediction", "gold")
+        ]
+        self.mock_data_manager.get_labeled_dataset.return_value = examples
+        self.mock_lm.side_effect = lambda prompt: "0.9" if "Q1" in prompt else "0.1"
+        
+        evaluator = MetricEvaluator(MetricModule(lm=self.mock_lm, cache=False), self.mock_data_manager)
+        metrics = asyncio.run(evaluator.aevaluate(max_concurrency=2))
+        
+        self.assertEqual(metrics, evaluator.evaluate())
+        self.assertEqual(metrics["num_examples"], 2)
+        self.assertAlmostEqual(metrics["mae"], 0.1)
+        
+        # Nothing labeled
+        self.mock_data_manager.has_labeled.return_value = False
+        with patch('sys.stdout', new=io.StringIO()):
+            self.assertEqual(asyncio.run(evaluator.aevaluate()), {})
+    
     def test_metric_evaluator_no_variance(self):
         """Test the MetricEvaluator when there's no variance in scores."""
         # Create examples with the same user score
@@ -201,7 +377,7 @@ class TestOptimization(unittest.TestCase):
         self.mock_lm.side_effect = ["0.5", "0.7"]
         
         # Create an evaluator
-        evaluator = MetricEvaluator(self.metric_module, self.mock_data_manager)
+        evaluator = MetricEvaluator(self.metric_module, self.mock_data_manager, num_threads=1)
         
         # Evaluate
         metrics = evaluator.evaluate()
@@ -255,74 +431,32 @@ class TestOptimization(unittest.TestCase):
         # Check that correlation is 0.0 due to zero variance in both scores
         self.assertEqual(metrics["correlation"], 0.0)
 
-    def test_metric_evaluator_with_numpy_mocking(self):
-        """Test the MetricEvaluator with specific numpy mocking to cover edge cases."""
-        # Create examples with different user scores
-        examples = [
-            dspy.Example(input="Q1", prediction="A1", gold="A1", user_score=0.5).with_inputs("input", "prediction", "gold"),
-            dspy.Example(input="Q2", prediction="A2", gold="A2", user_score=0.8).with_inputs("input", "prediction", "gold")
+    def test_pearson(self):
+        """Test the correlation helper against np.corrcoef and its zero-variance cases."""
+        rng = np.random.default_rng(0)
+        user_scores = rng.random(50)
+        model_scores = 0.5 * user_scores + 0.5 * rng.random(50)
+        self.assertAlmostEqual(
+            _pearson(user_scores, model_scores),
+            np.corrcoef(user_scores, model_scores)[0, 1],
+            places=12
+        )
+        
+        # Perfectly (anti-)correlated scores stay within [-1, 1]
+        for model_scores, expected in [([0.2, 0.4, 0.6], 1.0), ([0.6, 0.4, 0.2], -1.0)]:
+            correlation = _pearson(np.array([0.1, 0.2, 0.3]), np.array(model_scores))
+            self.assertAlmostEqual(correlation, expected, places=12)
+            self.assertLessEqual(abs(correlation), 1.0)
+        
+        # No variance in either array means no correlation
+        cases = [
+            ("model scores", [0.5, 0.8], [0.6, 0.6]),
+            ("user scores", [0.5, 0.5], [0.6, 0.7]),
+            ("both", [0.7, 0.7], [0.7, 0.7]),
         ]
-        
-        # Set up the mock data manager to return the examples
-        self.mock_data_manager.get_labeled_dataset.return_value = examples
-        
-        # Set up the metric module to return different scores
-        self.mock_lm.side_effect = ["0.6", "0.7"]
-        
-        # Create an evaluator
-        evaluator = MetricEvaluator(self.metric_module, self.mock_data_manager)
-        
-        # Mock numpy functions to force specific behavior
-        original_std = np.std
-        original_corrcoef = np.corrcoef
-        
-        def mock_std(array):
-            # Return 0 for model_scores, but normal value for user_scores
-            if len(array) == 2 and array[0] == 0.6 and array[1] == 0.7:
-                return 0.0
-            return original_std(array)
-            
-        def mock_corrcoef(array1, array2):
-            # This should never be called due to the std check
-            # But if it is, return a dummy value
-            return np.array([[1.0, 0.5], [0.5, 1.0]])
-        
-        with unittest.mock.patch('numpy.std', side_effect=mock_std):
-            with unittest.mock.patch('numpy.corrcoef', side_effect=mock_corrcoef):
-                # Evaluate
-                metrics = evaluator.evaluate()
-                
-                # Check that correlation is 0.0 due to zero variance in model scores
-                self.assertEqual(metrics["correlation"], 0.0)
-
-    def test_metric_evaluator_with_direct_numpy_mocking(self):
-        """Test the MetricEvaluator with direct numpy mocking to cover edge cases."""
-        # Create examples with different user scores
-        examples = [
-            dspy.Example(input="Q1", prediction="A1", gold="A1", user_score=0.5).with_inputs("input", "prediction", "gold"),
-            dspy.Example(input="Q2", prediction="A2", gold="A2", user_score=0.8).with_inputs("input", "prediction", "gold")
-        ]
-        
-        # Set up the mock data manager to return the examples
-        self.mock_data_manager.get_labeled_dataset.return_value = examples
-        
-        # Set up the metric module to return different scores
-        self.mock_lm.side_effect = ["0.6", "0.7"]
-        
-        # Create an evaluator
-        evaluator = MetricEvaluator(self.metric_module, self.mock_data_manager)
-        
-        # Directly patch the specific numpy functions at the module level
-        # This is more targeted than the previous approach
-        with patch('metric_learner.optimization.np.std') as mock_std:
-            # First test: user_scores have variance but model_scores don't
-            mock_std.side_effect = lambda x: 0.0 if len(x) == 2 and all(isinstance(v, float) for v in x) else 0.15
-            
-            # Evaluate
-            metrics = evaluator.evaluate()
-            
-            # Check that correlation is 0.0 due to zero variance in model scores
-            self.assertEqual(metrics["correlation"], 0.0)
+        for constant, user_scores, model_scores in cases:
+            with self.subTest(constant=constant):
+                self.assertEqual(_pearson(np.array(user_scores), np.array(model_scores)), 0.0)
     
     def test_metric_evaluator_with_variance_in_both_scores(self):
         """Test the MetricEvaluator with variance in both user and model scores."""
@@ -339,23 +473,15 @@ class TestOptimization(unittest.TestCase):
         self.mock_lm.side_effect = ["0.6", "0.7"]
         
         # Create an evaluator
-        evaluator = MetricEvaluator(self.metric_module, self.mock_data_manager)
+        evaluator = MetricEvaluator(self.metric_module, self.mock_data_manager, num_threads=1)
         
-        # Mock both np.std and np.corrcoef
-        with patch('metric_learner.optimization.np.std') as mock_std, \
-             patch('metric_learner.optimization.np.corrcoef') as mock_corrcoef:
-            
-            # Make np.std always return a positive value to ensure variance check passes
-            mock_std.return_value = 0.15
-            
-            # Set up the mock to return a correlation matrix with a known value
-            mock_corrcoef.return_value = np.array([[1.0, 0.75], [0.75, 1.0]])
-            
+        # Mock the correlation helper to return a known value
+        with patch('metric_learner.optimization._pearson', return_value=0.75) as mock_pearson:
             # Evaluate
             metrics = evaluator.evaluate()
             
-            # Verify that np.corrcoef was called
-            mock_corrcoef.assert_called_once()
+            # Verify that the helper was called
+            mock_pearson.assert_called_once()
             
             # Check that correlation is the expected value from our mock
             self.assertEqual(metrics["correlation"], 0.75)
@@ -400,37 +526,6 @@ class TestOptimization(unittest.TestCase):
         # Verify that a message was printed
         # This is captured in the test output
 
-    def test_metric_evaluator_with_no_user_scores(self):
-        """Test the MetricEvaluator with examples that don't have user_score attribute."""
-        # Create examples with user_score
-        examples = [
-            dspy.Example(input="Q1", prediction="A1", gold="A1", user_score=0.5).with_inputs("input", "prediction", "gold"),
-            dspy.Example(input="Q2", prediction="A2", gold="A2", user_score=0.5).with_inputs("input", "prediction", "gold")
-        ]
-        
-        # Set up the mock data manager to return the examples
-        self.mock_data_manager.get_labeled_dataset.return_value = examples
-        
-        # Create an evaluator
-        evaluator = MetricEvaluator(self.metric_module, self.mock_data_manager)
-        
-        # Mock both np.std and np.corrcoef
-        with patch('metric_learner.optimization.np.std') as mock_std, \
-             patch('metric_learner.optimization.np.corrcoef') as mock_corrcoef:
-            
-            # Make np.std return 0 for the first call and a positive value for the second
-            # This ensures we hit the else branch in the if-else statement
-            mock_std.side_effect = [0.0, 0.15]
-            
-            # Evaluate
-            metrics = evaluator.evaluate()
-            
-            # Check that correlation is 0.0 due to zero variance in user scores
-            self.assertEqual(metrics["correlation"], 0.0)
-            
-            # Verify that np.corrcoef was not called
-            mock_corrcoef.assert_not_called()
-
     def test_metric_evaluator_with_single_example(self):
         """Test the MetricEvaluator with a single example."""
         # Create a single example with user_score
@@ -459,5 +554,60 @@ class TestOptimization(unittest.TestCase):
         self.assertAlmostEqual(metrics["mae"], 0.1, places=10)   # |0.6 - 0.5| = 0.1
         self.assertAlmostEqual(metrics["max_error"], 0.1, places=10)
 
+    def test_metric_evaluator_scores_each_example_once(self):
+        """Test that the evaluator queries the metric module once per example."""
+        examples = [
+            dspy.Example(input="Q1", prediction="A1", gold="A1", user_score=0.2).with_inputs("input", "prediction", "gold"),
+            dspy.Example(input="Q2", prediction="A2", gold="A2", user_score=0.4).with_inputs("input", "prediction", "gold"),
+            dspy.Example(input="Q3", prediction="A3", gold="A3", user_score=0.9).with_inputs("input", "prediction", "gold")
+        ]
+        self.mock_data_manager.get_labeled_dataset.return_value = examples
+        self.mock_lm.side_effect = ["0.1", "0.5", "0.9"]
+        
+        evaluator = MetricEvaluator(self.metric_module, self.mock_data_manager, num_threads=1)
+        metrics = evaluator.evaluate()
+        
+        self.assertEqual(self.mock_lm.call_count, 3)
+        self.assertAlmostEqual(metrics["mse"], (0.01 + 0.01 + 0.0) / 3, places=10)
+        self.assertAlmostEqual(metrics["mae"], 0.2 / 3, places=10)
+        self.assertAlmostEqual(metrics["max_error"], 0.1, places=10)
+        self.assertAlmostEqual(
+            metrics["correlation"],
+            np.corrcoef([0.2, 0.4, 0.9], [0.1, 0.5, 0.9])[0, 1],
+            places=10
+        )
+    
+    def test_metric_evaluator_skips_unlabeled_data(self):
+        """Test that the labeled dataset is not built when nothing is labeled."""
+        self.mock_data_manager.has_labeled.return_value = False
+        
+        evaluator = MetricEvaluator(self.metric_module, self.mock_data_manager)
+        
+        self.assertEqual(evaluator.evaluate(), {})
+        self.mock_data_manager.get_labeled_dataset.assert_not_called()
+    
+    def test_metric_evaluator_parallel_preserves_order(self):
+        """Test that scores computed in threads stay aligned with their examples."""
+        def slow_lm(prompt):
+            # Finish earlier examples last
+            for i, delay in ((1, 0.03), (2, 0.02), (3, 0.01), (4, 0.0)):
+                if f"Q{i}" in prompt:
+                    time.sleep(delay)
+                    return str(i / 10)
+        
+        self.mock_lm.side_effect = slow_lm
+        examples = [
+            dspy.Example(input=f"Q{i}", prediction=f"A{i}", gold=None, user_score=i / 10).with_inputs("input", "prediction", "gold")
+            for i in range(1, 5)
+        ]
+        self.mock_data_manager.get_labeled_dataset.return_value = examples
+        
+        evaluator = MetricEvaluator(self.metric_module, self.mock_data_manager, num_threads=4)
+        metrics = evaluator.evaluate()
+        
+        self.assertEqual(self.mock_lm.call_count, 4)
+        self.assertAlmostEqual(metrics["mse"], 0.0, places=10)
+        self.assertAlmostEqual(metrics["correlation"], 1.0, places=10)
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,12 +1,8 @@
 import sys
-import os
 import unittest
 from unittest.mock import MagicMock, patch
 import io
 
-# Add the parent directory to the path to import the package
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-
 from metric_learner.repl_interface import label_instances
 from metric_learner.data_manager import MetricDataManager
 
@@ -22,6 +18,17 @@ class TestREPLInterface(unittest.TestCase):
             {"id": "2", "datetime": "2023-01-02", "input": "test input 2", "prediction": "test pred 2", "user_score": None},
         ]
         
+        # Derive the counts and unlabeled stream from load_instances' return value
+        def unlabeled():
+            return [i for i in self.data_manager.load_instances.return_value if i.get("user_score") is None]
+        
+        self.data_manager.count_instances.side_effect = lambda: len(self.data_manager.load_instances.return_value)
+        self.data_manager.count_unlabeled.side_effect = lambda: len(unlabeled())
+        self.data_manager.iter_unlabeled.side_effect = lambda: iter(unlabeled())
+        self.data_manager.update_user_score_in_place.side_effect = (
+            lambda instance, score: self.data_manager.update_user_score(instance["datetime"], score)
+        )
+        
     def test_label_instances_no_unlabeled(self):
         """Test labeling when there are no unlabeled instances."""
         # Set up the data manager to return instances with all labeled
@@ -56,6 +63,9 @@ class TestREPLInterface(unittest.TestCase):
         # Verify that update_user_score was called with the correct arguments
         self.data_manager.update_user_score.assert_called_once_with("2023-01-02", 0.7)
         
+        # The loaded instance is passed on, so it is not read back from disk
+        self.data_manager.update_user_score_in_place.assert_called_once_with(self.instances[1], 0.7)
+        
     @patch('builtins.input')
     def test_label_instances_with_invalid_score(self, mock_input):
         """Test labeling an instance with an invalid score."""
@@ -92,6 +102,7 @@ class TestREPLInterface(unittest.TestCase):
         
         # Verify that update_user_score was not called
         self.data_manager.update_user_score.assert_not_called()
+        self.data_manager.compact_log.assert_not_called()
         
     @patch('builtins.input')
     def test_label_instances_quit(self, mock_input):
@@ -175,6 +186,68 @@ class TestREPLInterface(unittest.TestCase):
         
         # Verify that error message was displayed
         self.assertIn("Failed to save score", output)
+        self.assertIn("You have labeled 1/2 instances", output)
+
+    @patch('builtins.input')
+    def test_label_instances_summary_counts_new_labels(self, mock_input):
+        """Test that the summary includes scores saved in this session."""
+        self.data_manager.load_instances.return_value = self.instances
+        self.data_manager.update_user_score.return_value = True
+        mock_input.side_effect = ["0.7"]
+
+        with patch('sys.stdout', new=io.StringIO()) as fake_out:
+            label_instances(self.data_manager)
+            output = fake_out.getvalue()
+
+        self.assertIn("You have labeled 2/2 instances", output)
+        self.data_manager.iter_unlabeled.assert_called_once()
+        self.data_manager.compact_log.assert_called_once()
+
+    @patch('builtins.input')
+    def test_label_instances_type_ahead(self, mock_input):
+        """Test that several answers on one line label the following instances."""
+        self.data_manager.load_instances.return_value = [
+            {"datetime": "2023-01-01", "input": "test input 1", "prediction": "test pred 1", "user_score": None},
+            {"datetime": "2023-01-02", "input": "test input 2", "prediction": "test pred 2", "user_score": None},
+            {"datetime": "2023-01-03", "input": "test input 3", "prediction": "test pred 3", "user_score": None},
+        ]
+        mock_input.side_effect = ["0.7 skip 0.4"]
+
+        with patch('sys.stdout', new=io.StringIO()):
+            label_instances(self.data_manager)
+
+        mock_input.assert_called_once()
+        self.assertEqual(
+            [c.args for c in self.data_manager.update_user_score.call_args_list],
+            [("2023-01-01", 0.7), ("2023-01-03", 0.4)]
+        )
+
+    @patch('builtins.input')
+    def test_label_instances_common_scores(self, mock_input):
+        """Test that common scores are accepted as floats."""
+        self.data_manager.load_instances.return_value = [
+            {"datetime": "2023-01-01", "input": "test input 1", "prediction": "test pred 1", "user_score": None},
+            {"datetime": "2023-01-02", "input": "test input 2", "prediction": "test pred 2", "user_score": None},
+        ]
+        mock_input.side_effect = ["1", "0"]
+
+        with patch('sys.stdout', new=io.StringIO()):
+            label_instances(self.data_manager)
+
+        scores = [c.args[1] for c in self.data_manager.update_user_score.call_args_list]
+        self.assertEqual(scores, [1.0, 0.0])
+        self.assertTrue(all(isinstance(score, float) for score in scores))
+
+    @patch('builtins.input')
+    def test_label_instances_type_ahead_discarded_on_error(self, mock_input):
+        """Test that answers typed after an invalid one are not applied."""
+        self.data_manager.load_instances.return_value = self.instances
+        mock_input.side_effect = ["1.5 0.3", "0.6"]
+
+        with patch('sys.stdout', new=io.StringIO()):
+            label_instances(self.data_manager)
+
+        self.data_manager.update_user_score.assert_called_once_with("2023-01-02", 0.6)
 
 if __name__ == '__main__':
     unittest.main()